@@ -0,0 +1,91 @@
+"""
+Animating the L-system fractals in fractals.py growing, one iteration per
+frame.
+
+Each frame is built from the one before it rather than from the start of the
+fractal: the expansion for iteration k + 1 is one substitution of the
+expansion for iteration k, and its layout is built from the transforms cached
+while laying out iteration k (see fractal_layout.py). As expansions grow
+geometrically, the whole animation costs little more than its final frame.
+Frames are fitted to the canvas and streamed out as a numbered sequence of PNG
+images.
+"""
+
+import os
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+
+import fractals
+from fractals import FRACTAL_REGISTRY, CHUNK_SIZE
+from fractal_export import write_png
+from fractal_geometry import (compile_rules, substitute_codes, trace_codes,
+                              rasterise)
+from fractal_layout import fit_fractal
+
+# name of each frame in the output directory
+FRAME_NAME = "frame_{:04d}.png"
+
+def get_args():
+    """
+    Get the fractal to animate and where to put the frames
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("fractal", type=int,
+                    help="index of the fractal in the registry")
+    parser.add_argument("directory", help="directory to write frames into")
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations to grow to, rather than the "
+                         "default")
+    return parser.parse_args()
+
+def iter_expansions(fractal, iterations=None):
+    """
+    Generate the expansion after each number of iterations from 0 up to and
+    including iterations, as arrays of byte values, each substituted from the
+    last.
+    """
+    if iterations is None:
+        iterations = fractal.iterations
+    tables = compile_rules(fractal.rules)
+    codes = np.frombuffer(fractal.start.encode("ascii"), dtype=np.uint8)
+    yield codes
+    for _ in range(iterations):
+        codes = substitute_codes(codes, tables)
+        yield codes
+
+def iter_frames(fractal, iterations=None, chunk_size=CHUNK_SIZE):
+    """
+    Generate the frames of a fractal growing as boolean images the size of the
+    canvas, each fitted to the canvas.
+    """
+    for depth, codes in enumerate(iter_expansions(fractal, iterations)):
+        fitted, start = fit_fractal(fractal, fractals.w, fractals.h, depth)
+        chunks = (codes[i:i + chunk_size]
+                  for i in range(0, len(codes), chunk_size))
+        image = np.zeros((fractals.h, fractals.w), dtype=bool)
+        for segments in trace_codes(chunks, fitted.draw_rules, start):
+            rasterise(segments, image)
+        yield image
+
+def write_frames(frames, directory):
+    """
+    Write a stream of frames into a directory as numbered PNG images, each
+    written as soon as it has been drawn. Returns the number of frames.
+    """
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for count, frame in enumerate(frames, 1):
+        with open(os.path.join(directory, FRAME_NAME.format(count - 1)),
+                  "wb") as f:
+            write_png(frame, f)
+    return count
+
+if __name__ == "__main__":
+    args = get_args()
+    start = perf_counter()
+    count = write_frames(iter_frames(FRACTAL_REGISTRY[args.fractal],
+                                     args.iterations), args.directory)
+    print("{} frames in {:.3f}s".format(count, perf_counter() - start))
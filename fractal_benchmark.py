@@ -0,0 +1,131 @@
+"""
+Benchmarks for expanding and rendering the L-system fractals in fractals.py.
+
+Every fractal in the registry is run over a sweep of iteration counts, and for
+each run one JSON record is written per line, so that results from different
+versions can be compared by other tools. Each record has:
+
+- expand_rate: symbols per second drained from fractals.expand
+- chunked_expand_rate: symbols per second from fractals.expand_chunks
+- codes_expand_rate: symbols per second from fractal_geometry.expand_codes
+- level_overhead_ns: time per symbol per layer of generators in expand
+- render_rate: segments per second from fractal_geometry.iter_segments
+- peak_memory: peak bytes allocated by Python while rendering
+
+Expansion lengths are known in advance (see fractal_index.py), so runs which
+would be too big are skipped without being attempted.
+"""
+
+import json
+import tracemalloc
+
+from argparse import ArgumentParser
+from collections import deque
+from platform import python_version
+from time import perf_counter
+
+import numpy as np
+
+from fractals import FRACTAL_REGISTRY, expand, expand_chunks
+from fractal_geometry import expand_codes, iter_segments
+from fractal_index import expansion_length
+
+def get_args():
+    """
+    Get the sweep of iteration counts to benchmark
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-o", "--offsets", type=int, nargs="+",
+                    default=[-2, 0, 2],
+                    help="iteration counts to try, relative to each default")
+    parser.add_argument("-m", "--max-symbols", type=int, default=10 ** 7,
+                    help="skip runs with more symbols than this")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                    help="number of times to time each run, keeping the best")
+    parser.add_argument("--no-memory", action="store_true",
+                    help="don't measure peak memory, which takes a while")
+    return parser.parse_args()
+
+def best_time(function, repeat):
+    """
+    Time a function, returning the shortest of several runs.
+    """
+    times = []
+    for _ in range(repeat):
+        begin = perf_counter()
+        function()
+        times.append(perf_counter() - begin)
+    return min(times)
+
+def count_segments(fractal, iterations):
+    return sum(len(segments)
+               for segments in iter_segments(fractal, iterations))
+
+def peak_memory(function):
+    """
+    Peak memory allocated by Python while running a function.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark(fractal, iterations, repeat=3, memory=True):
+    """
+    Benchmark one fractal at one iteration count, returning a dictionary of
+    results.
+    """
+    symbols = expansion_length(fractal, iterations)
+    expand_time = best_time(
+        lambda: deque(expand(fractal, iterations), maxlen=0), repeat)
+    chunked_time = best_time(
+        lambda: deque(expand_chunks(fractal, iterations), maxlen=0), repeat)
+    codes_time = best_time(
+        lambda: deque(expand_codes(fractal, iterations), maxlen=0), repeat)
+    flat_time = best_time(
+        lambda: deque(iter(range(symbols)), maxlen=0), repeat)
+    segments = count_segments(fractal, iterations)
+    render_time = best_time(lambda: count_segments(fractal, iterations),
+                            repeat)
+    record = {
+        "fractal": fractal.name,
+        "iterations": iterations,
+        "symbols": symbols,
+        "segments": segments,
+        "expand_seconds": expand_time,
+        "expand_rate": symbols / expand_time,
+        "chunked_expand_seconds": chunked_time,
+        "chunked_expand_rate": symbols / chunked_time,
+        "codes_expand_seconds": codes_time,
+        "codes_expand_rate": symbols / codes_time,
+        "level_overhead_ns": (1e9 * (expand_time - flat_time)
+                              / symbols / max(iterations, 1)),
+        "render_seconds": render_time,
+        "render_rate": segments / render_time,
+        "python": python_version(),
+        "numpy": np.__version__,
+    }
+    if memory:
+        record["peak_memory"] = peak_memory(
+            lambda: count_segments(fractal, iterations))
+    return record
+
+def run_benchmarks(offsets, max_symbols, repeat=3, memory=True):
+    """
+    Lazily benchmark every fractal in the registry over a sweep of iteration
+    counts.
+    """
+    for fractal in FRACTAL_REGISTRY:
+        for offset in offsets:
+            iterations = fractal.iterations + offset
+            if (iterations >= 0
+                    and expansion_length(fractal, iterations) <= max_symbols):
+                yield benchmark(fractal, iterations, repeat, memory)
+
+if __name__ == "__main__":
+    args = get_args()
+    for record in run_benchmarks(args.offsets, args.max_symbols, args.repeat,
+                                 not args.no_memory):
+        print(json.dumps(record), flush=True)
@@ -0,0 +1,172 @@
+"""
+Persistent on-disk cache of expanded and traced L-system fractals.
+
+Expansions are stored as arrays of byte values, and traced fractals as arrays
+of segments (see fractal_geometry.py), in .npy files named by a hash of
+everything that determines their contents. They are loaded back as memory
+maps, so nothing is read from disk until it is used. Both sizes are known in
+advance (see fractal_index.py), so files are written straight into place a
+chunk at a time. When the cache grows past its size limit, the least recently
+used files are deleted.
+"""
+
+import os
+
+from argparse import ArgumentParser
+from hashlib import sha256
+from itertools import chain
+from time import perf_counter
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import fractals
+from fractals import FRACTAL_REGISTRY, CHUNK_SIZE, Forward
+from fractal_geometry import expand_codes, iter_segments
+from fractal_index import expansion_length, symbol_counts
+
+CACHE_DIR = os.environ.get("FRACTAL_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache",
+                                        "python_demo_fractals"))
+# total size of the cache before old entries start being evicted
+MAX_CACHE_BYTES = 1 << 30
+
+def get_args():
+    """
+    Get the fractal to cache, for a demo run
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("fractal", type=int,
+                    help="index of the fractal in the registry")
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than the default")
+    return parser.parse_args()
+
+def _describe_rule(rule):
+    """
+    Stable description of a draw rule, to be hashed. The draw rules which are
+    plain functions are described by name, as their repr changes between runs.
+    """
+    return getattr(rule, "__name__", None) or repr(rule)
+
+def cache_key(fractal, iterations, kind):
+    """
+    Hash everything determining the contents of a cache entry. Expansions only
+    depend on the start and the rules, but segments also depend on the draw
+    rules and the size of the canvas.
+    """
+    if iterations is None:
+        iterations = fractal.iterations
+    parts = [kind, fractal.start, sorted(fractal.rules.items()), iterations]
+    if kind == "segments":
+        parts += [sorted((symbol, _describe_rule(rule))
+                         for symbol, rule in fractal.draw_rules.items()),
+                  fractals.w, fractals.h]
+    return sha256(repr(parts).encode()).hexdigest()
+
+def _path(key):
+    return os.path.join(CACHE_DIR, key + ".npy")
+
+def _load(key):
+    """
+    Load a cache entry as a read-only memory map, marking it as recently used,
+    or return None if it isn't there.
+    """
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    os.utime(path)
+    return np.load(path, mmap_mode="r")
+
+def _store(key, shape, dtype, chunks):
+    """
+    Write a stream of arrays into a new cache entry of known shape. The entry
+    is written under a temporary name and then renamed, so that an interrupted
+    write never leaves a broken entry behind.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _path(key)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    array = open_memmap(temporary, mode="w+", dtype=dtype, shape=shape)
+    try:
+        position = 0
+        for chunk in chunks:
+            array[position:position + len(chunk)] = chunk
+            position += len(chunk)
+        array.flush()
+    except BaseException:
+        del array
+        os.remove(temporary)
+        raise
+    del array
+    os.replace(temporary, path)
+    evict(keep=key)
+    return _load(key)
+
+def evict(max_bytes=MAX_CACHE_BYTES, keep=None):
+    """
+    Delete the least recently used cache entries until the cache fits in
+    max_bytes. The entry keep is never deleted, even if it doesn't fit by
+    itself, so that an entry which has just been stored can still be loaded.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".npy") and name != "{}.npy".format(keep):
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(_path(keep)):
+        total += os.path.getsize(_path(keep))
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(CACHE_DIR, name))
+        total -= size
+
+def cached_codes(fractal, iterations=None):
+    """
+    Get the expansion of a fractal as a memory-mapped array of byte values,
+    expanding and storing it first if it isn't in the cache.
+    """
+    key = cache_key(fractal, iterations, "codes")
+    codes = _load(key)
+    if codes is None:
+        codes = _store(key, (expansion_length(fractal, iterations),), np.uint8,
+                       expand_codes(fractal, iterations))
+    return codes
+
+def cached_segments(fractal, iterations=None):
+    """
+    Get the segments making up a fractal as a memory-mapped (n, 4) array,
+    tracing and storing them first if they aren't in the cache.
+    """
+    key = cache_key(fractal, iterations, "segments")
+    segments = _load(key)
+    if segments is None:
+        counts = symbol_counts(fractal, iterations)
+        total = sum(count for symbol, count in counts.items()
+                    if isinstance(fractal.draw_rules.get(symbol), Forward))
+        segments = _store(key, (total, 4), float,
+                          iter_segments(fractal, iterations))
+    return segments
+
+def cached_expansion(fractal, iterations=None, chunk_size=CHUNK_SIZE):
+    """
+    Lazily generate the expansion of a fractal symbol by symbol from the cache,
+    for drawing. Only chunk_size symbols are decoded at a time.
+    """
+    codes = cached_codes(fractal, iterations)
+    return chain.from_iterable(
+        codes[i:i + chunk_size].tobytes().decode("ascii")
+        for i in range(0, len(codes), chunk_size))
+
+if __name__ == "__main__":
+    args = get_args()
+    fractal = FRACTAL_REGISTRY[args.fractal]
+    for attempt in ["first", "second"]:
+        start = perf_counter()
+        segments = cached_segments(fractal, args.iterations)
+        print("{} load: {} segments in {:.3f}s".format(attempt, len(segments),
+                                                      perf_counter() - start))
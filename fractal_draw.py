@@ -0,0 +1,93 @@
+"""
+Draw the L-system fractals in fractals.py with the turtle, choosing them
+interactively, or draw or render just one of them.
+
+Drawing happens in a DrawPipeline, so Ctrl+C interrupts it straight away. When
+drawing just one fractal, pressing Ctrl+C again closes the window.
+"""
+
+from argparse import ArgumentParser
+from signal import signal, SIGINT
+
+import fractals
+from fractals import FRACTAL_REGISTRY, draw_fractal_pipelined
+
+def get_args():
+    """
+    Get a fractal to render without interaction, if any
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("fractal", type=int, nargs="?",
+                    help="index of the fractal to draw, rather than choosing "
+                         "interactively")
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than the default")
+    parser.add_argument("-o", "--output",
+                    help="render to a .svg or .png file instead of the screen "
+                         "(see fractal_export.py)")
+    parser.add_argument("-l", "--list", action="store_true",
+                    help="list the available fractals and exit")
+    return parser.parse_args()
+
+def list_fractals():
+    print("Available fractals:")
+    print("\n".join(
+        "{}: {}".format(ind, i.name)
+        for ind, i in enumerate(FRACTAL_REGISTRY)))
+
+def interact():
+    """
+    Repeatedly ask which fractal to draw, and draw it.
+    """
+    while True:
+        list_fractals()
+        result = input("Enter number of fractal > ")
+        try:
+            result = int(result)
+            if not (0 <= result < len(FRACTAL_REGISTRY)):
+                raise ValueError("outside of range")
+            print("Press Ctrl+C to interrupt")
+            pipeline = draw_fractal_pipelined(FRACTAL_REGISTRY[result],
+                                              fit=True)
+            previous = signal(SIGINT, lambda *_: pipeline.cancel())
+            try:
+                pipeline.wait()
+            finally:
+                signal(SIGINT, previous)
+        except ValueError as ve:
+            print("error: {}".format(ve))
+
+def interrupt(pipeline):
+    """
+    Handle Ctrl+C while drawing one fractal: the first stops drawing, and any
+    after that close the window, which would otherwise have to be closed by
+    hand.
+    """
+    if pipeline.done():
+        fractals.t.bye()
+    else:
+        pipeline.cancel()
+        print("Press Ctrl+C again to close the window")
+
+def main():
+    args = get_args()
+    if args.list:
+        list_fractals()
+    elif args.fractal is None:
+        interact()
+    else:
+        fractal = FRACTAL_REGISTRY[args.fractal]
+        if args.output:
+            from fractal_export import export
+            export(fractal, args.output, args.iterations, fit=True)
+        else:
+            pipeline = draw_fractal_pipelined(fractal, args.iterations,
+                                              fit=True)
+            print("Press Escape or Ctrl+C to interrupt")
+            fractals.t.onkey(pipeline.cancel, "Escape")
+            fractals.t.listen()
+            signal(SIGINT, lambda *_: interrupt(pipeline))
+            fractals.t.done()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Exporting the L-system fractals in fractals.py to SVG and PNG files.
+
+Both formats are written as the expansion is consumed, one chunk of segments
+at a time (see fractal_geometry.py), so memory use stays flat however many
+segments a fractal has. SVG path data is written out straight away, and PNG
+images are rasterised into a bitmap the size of the canvas, which is then
+compressed one row at a time.
+"""
+
+from argparse import ArgumentParser
+from os.path import splitext
+from struct import pack
+from zlib import compressobj, crc32
+
+import numpy as np
+
+import fractals
+from fractals import FRACTAL_REGISTRY
+from fractal_geometry import CHUNK_SIZE, iter_segments, render
+from fractal_layout import fit_fractal
+
+# segments whose ends are closer than this are joined up in SVG paths
+JOIN_TOLERANCE = 1e-6
+
+def get_args():
+    """
+    Get the fractal to export, and where to
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("fractal", type=int,
+                    help="index of the fractal in the registry")
+    parser.add_argument("output", help="file to write, ending in .svg or .png")
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than the default")
+    parser.add_argument("-f", "--fit", action="store_true",
+                    help="scale and centre the fractal to fill the canvas")
+    return parser.parse_args()
+
+def svg_path_data(segments, position=None):
+    """
+    Lazily generate pieces of SVG path data for a stream of segment arrays,
+    only moving the pen where consecutive segments don't join up. SVG has y
+    pointing down, so y coordinates are flipped.
+    """
+    for chunk in segments:
+        starts = chunk[:, :2]
+        ends = chunk[:, 2:]
+        previous = np.vstack((np.full(2, np.inf) if position is None
+                              else position, ends[:-1]))
+        moves = (abs(starts - previous) > JOIN_TOLERANCE).any(axis=1)
+        yield "".join(
+            "M{:.2f} {:.2f}L{:.2f} {:.2f}".format(x0, -y0, x1, -y1) if move
+            else "L{:.2f} {:.2f}".format(x1, -y1)
+            for move, (x0, y0, x1, y1) in zip(moves, chunk.tolist()))
+        position = ends[-1]
+
+def write_svg(fractal, f, iterations=None, chunk_size=CHUNK_SIZE,
+              start=None):
+    """
+    Write a fractal to a text file as an SVG image the size of the canvas,
+    drawn from start, as in trace_codes.
+    """
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" '
+            'viewBox="{} {} {} {}" width="{}" height="{}">\n'
+            .format(-fractals.w / 2, -fractals.h / 2, fractals.w, fractals.h,
+                    fractals.w, fractals.h))
+    f.write('<path fill="none" stroke="black" d="')
+    for data in svg_path_data(iter_segments(fractal, iterations, chunk_size,
+                                            start)):
+        f.write(data)
+    f.write('"/>\n</svg>\n')
+
+def _png_chunk(f, kind, data):
+    f.write(pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(pack(">I", crc32(data, crc32(kind))))
+
+def write_png(image, f):
+    """
+    Write a boolean image to a binary file as a black-on-white greyscale PNG,
+    compressing it one row at a time.
+    """
+    height, width = image.shape
+    f.write(b"\x89PNG\r\n\x1a\n")
+    _png_chunk(f, b"IHDR", pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+    compressor = compressobj()
+    for row in image:
+        # each row starts with a filter type, which is 0 for no filter
+        data = compressor.compress(
+            b"\0" + np.where(row, 0, 255).astype(np.uint8).tobytes())
+        if data:
+            _png_chunk(f, b"IDAT", data)
+    _png_chunk(f, b"IDAT", compressor.flush())
+    _png_chunk(f, b"IEND", b"")
+
+def export(fractal, filename, iterations=None, chunk_size=CHUNK_SIZE,
+           fit=False):
+    """
+    Export a fractal to a file, choosing the format by its extension. If fit
+    is set, the fractal is scaled and centred to fill the canvas, as in
+    draw_fractal.
+    """
+    extension = splitext(filename)[1].lower()
+    start = None
+    if fit:
+        fractal, start = fit_fractal(fractal, fractals.w, fractals.h,
+                                     iterations)
+    if extension == ".svg":
+        with open(filename, "w") as f:
+            write_svg(fractal, f, iterations, chunk_size, start)
+    elif extension == ".png":
+        image = render(fractal, iterations, chunk_size, start)
+        with open(filename, "wb") as f:
+            write_png(image, f)
+    else:
+        raise ValueError("cannot export to {!r} files".format(extension))
+
+if __name__ == "__main__":
+    args = get_args()
+    export(FRACTAL_REGISTRY[args.fractal], args.output, args.iterations,
+           fit=args.fit)
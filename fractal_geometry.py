@@ -0,0 +1,359 @@
+"""
+Headless geometry backend for the L-system fractals in fractals.py.
+
+Instead of driving a turtle one symbol at a time, the expanded symbol stream is
+consumed in fixed-size chunks (see expand_codes), and each chunk is turned into
+an array of line segments in one go: headings are a cumulative sum of turns,
+and positions a cumulative sum of displacements. Branches ([ and ]) are handled
+by correcting the cumulative sums at each closing bracket, so that the state
+after it is the state at its opening bracket. Brackets that are left open at
+the end of a chunk are kept on an array-backed stack for the following chunks.
+
+Segments are (x0, y0, x1, y1) rows in turtle coordinates, so they line up
+exactly with what draw_fractal would draw on the default canvas.
+"""
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from itertools import islice
+from time import perf_counter
+
+import numpy as np
+
+import fractals
+from fractals import (FRACTAL_REGISTRY, CHUNK_SIZE, Forward, Turn, Jump,
+                      save_state, restore_state, nop)
+
+# kinds of symbol, after interpreting the draw rules
+INVALID, NOP, FORWARD, TURN, PUSH, POP, JUMP = range(7)
+
+DrawTables = namedtuple("DrawTables", "kinds lengths turns jumps")
+RuleTables = namedtuple("RuleTables", "flat starts lengths")
+
+def get_args():
+    """
+    Get the iteration count override for a demo run
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than each default")
+    return parser.parse_args()
+
+def compile_rules(rules):
+    """
+    Compile substitution rules into a form which can be applied to a whole
+    array of byte values at once: all of the rules' expansions are laid out in
+    one flat array, after a copy of every byte value for the symbols which are
+    left alone, and each byte value is given the start and length of its
+    expansion in it.
+    """
+    flat = bytearray(range(256))
+    starts = np.arange(256)
+    lengths = np.ones(256, dtype=int)
+    for symbol, expansion in rules.items():
+        code = ord(symbol)
+        starts[code] = len(flat)
+        lengths[code] = len(expansion)
+        flat += expansion.encode("ascii")
+    return RuleTables(np.frombuffer(bytes(flat), dtype=np.uint8), starts,
+                      lengths)
+
+def substitute_codes(codes, tables):
+    """
+    Expand an array of byte values by one iteration, by gathering from the flat
+    array of expansions.
+    """
+    lengths = tables.lengths[codes]
+    ends = np.cumsum(lengths)
+    total = ends[-1] if len(ends) else 0
+    gather = (np.repeat(tables.starts[codes] - (ends - lengths), lengths)
+              + np.arange(total))
+    return tables.flat[gather]
+
+def _substitute_codes(chunks, tables, chunk_size):
+    """
+    Expand each array of byte values in a stream by one iteration, splitting
+    the results into pieces of at most chunk_size.
+    """
+    for codes in chunks:
+        expanded = substitute_codes(codes, tables)
+        for i in range(0, len(expanded), chunk_size):
+            yield expanded[i:i + chunk_size]
+
+def expand_codes(fractal, iterations=None, chunk_size=CHUNK_SIZE):
+    """
+    Lazily expand a fractal as a stream of arrays of byte values, of at most
+    chunk_size symbols each. This is the same as fractals.expand_chunks, but
+    each iteration is a vectorised gather rather than a str.translate, which
+    is faster still, and leaves the symbols ready to be traced.
+    """
+    if iterations is None:
+        iterations = fractal.iterations
+    return expand_sequence_codes(fractal.start, compile_rules(fractal.rules),
+                                 iterations, chunk_size)
+
+def expand_sequence_codes(sequence, tables, iterations, chunk_size=CHUNK_SIZE):
+    """
+    Lazily expand any sequence of symbols by compiled rules, like expand_codes.
+    """
+    codes = np.frombuffer(sequence.encode("ascii"), dtype=np.uint8)
+    chunks = (codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size))
+    for _ in range(iterations):
+        chunks = _substitute_codes(chunks, tables, chunk_size)
+    return chunks
+
+def compile_draw_rules(draw_rules):
+    """
+    Interpret a dictionary of draw rules as lookup tables indexed by byte value,
+    so that a whole array of symbols can be classified at once. The lengths of
+    forward moves are worked out against the current canvas width.
+    """
+    kinds = np.full(256, INVALID, dtype=np.uint8)
+    lengths = np.zeros(256)
+    turns = np.zeros(256)
+    jumps = {}
+    for symbol, rule in draw_rules.items():
+        code = ord(symbol)
+        if isinstance(rule, Forward):
+            kinds[code] = FORWARD
+            lengths[code] = rule.steps * fractals.w / rule.size
+        elif isinstance(rule, Turn):
+            kinds[code] = TURN
+            turns[code] = rule.angle
+        elif isinstance(rule, Jump):
+            kinds[code] = JUMP
+            jumps[code] = rule
+        elif rule is save_state:
+            kinds[code] = PUSH
+        elif rule is restore_state:
+            kinds[code] = POP
+        elif rule is nop:
+            kinds[code] = NOP
+        else:
+            raise ValueError("cannot interpret draw rule {!r} for {!r}"
+                             .format(rule, symbol))
+    return DrawTables(kinds, lengths, turns, jumps)
+
+class StateStack:
+    """
+    Stack of saved (x, y, heading) turtle states, stored in a numpy array which
+    grows as needed.
+    """
+    def __init__(self, states=None):
+        self.array = np.zeros((16, 3))
+        self.size = 0
+        if states is not None:
+            self.push(states)
+
+    def push(self, states):
+        if self.size + len(states) > len(self.array):
+            grown = np.zeros((2 * (self.size + len(states)), 3))
+            grown[:self.size] = self.array[:self.size]
+            self.array = grown
+        self.array[self.size:self.size + len(states)] = states
+        self.size += len(states)
+
+    def pop(self):
+        if not self.size:
+            raise ValueError("unbalanced ] in symbol stream")
+        self.size -= 1
+        return tuple(self.array[self.size])
+
+    def states(self):
+        return self.array[:self.size].copy()
+
+def start_state(start=None):
+    """
+    The turtle state at the start of draw_fractal - by default the bottom left
+    corner, facing right.
+    """
+    x, y = start or (-fractals.w / 2, -fractals.h / 2)
+    return x, y, 0.
+
+def _close_corrections(values, order, rank, opens, closes):
+    """
+    For each closing bracket, the negated sum of values directly inside its
+    group (not counting nested groups, which have already been cancelled out).
+    Sorting stably by nesting level makes the values directly inside a group
+    contiguous, so this is just a difference of cumulative sums.
+    """
+    sums = np.cumsum(values[order])
+    return sums[rank[opens]] - sums[rank[closes]]
+
+def _trace(codes, tables, x, y, heading):
+    """
+    Trace a run of symbols with no jumps and in which every closing bracket has
+    an opening bracket. Return the segments drawn, the final state, and the
+    states at any opening brackets which are left unclosed.
+    """
+    kinds = tables.kinds[codes]
+    is_open = kinds == PUSH
+    is_close = kinds == POP
+    turns = -tables.turns[codes]
+    steps = tables.lengths[codes]
+    brackets = np.flatnonzero(is_open | is_close)
+    if len(brackets):
+        depth = np.cumsum(is_open) - np.cumsum(is_close)
+        level = depth + is_close
+        order = np.argsort(level, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        # within a level, brackets alternate between opening and closing, so
+        # each closing bracket is matched by the one before it
+        by_level = brackets[np.argsort(level[brackets], kind="stable")]
+        closing = np.flatnonzero(is_close[by_level])
+        closes = by_level[closing]
+        opens = by_level[closing - 1]
+        turns[closes] += _close_corrections(turns, order, rank, opens, closes)
+    headings = heading + np.cumsum(turns)
+    theta = np.radians(headings)
+    dx = steps * np.cos(theta)
+    dy = steps * np.sin(theta)
+    if len(brackets):
+        dx[closes] += _close_corrections(dx, order, rank, opens, closes)
+        dy[closes] += _close_corrections(dy, order, rank, opens, closes)
+    xs = x + np.cumsum(dx)
+    ys = y + np.cumsum(dy)
+    moves = np.flatnonzero(kinds == FORWARD)
+    before = moves - 1
+    x0 = np.where(before >= 0, xs[before], x)
+    y0 = np.where(before >= 0, ys[before], y)
+    segments = np.column_stack((x0, y0, xs[moves], ys[moves]))
+    if len(brackets):
+        matched = np.zeros(len(codes), dtype=bool)
+        matched[opens] = True
+        unclosed = np.flatnonzero(is_open & ~matched)
+    else:
+        unclosed = brackets
+    unclosed_states = np.column_stack((xs[unclosed], ys[unclosed],
+                                       headings[unclosed]))
+    if len(codes):
+        x, y, heading = xs[-1], ys[-1], headings[-1]
+    return segments, (x, y, heading), unclosed_states
+
+def trace_chunk(codes, tables, state, stack):
+    """
+    Trace an arbitrary chunk of symbols from a given state, using and updating
+    the stack of saved states. The chunk is split at jumps and at closing
+    brackets whose opening bracket is on the stack, of which there are only
+    ever a few, and the pieces in between are traced in bulk.
+    """
+    if (tables.kinds[codes] == INVALID).any():
+        bad = codes[tables.kinds[codes] == INVALID][0]
+        raise ValueError("no draw rule for {!r}".format(chr(bad)))
+    kinds = tables.kinds[codes]
+    pieces = []
+    start = 0
+    for stop in [*np.flatnonzero(kinds == JUMP), len(codes)]:
+        is_open = kinds[start:stop] == PUSH
+        is_close = kinds[start:stop] == POP
+        depth = np.cumsum(is_open) - np.cumsum(is_close)
+        lowest = np.minimum(0, np.minimum.accumulate(depth))
+        lowest_before = np.concatenate(([0], lowest[:-1]))
+        for pop in start + np.flatnonzero(is_close & (depth < lowest_before)):
+            segments, state, unclosed = _trace(codes[start:pop], tables,
+                                               *state)
+            pieces.append(segments)
+            stack.push(unclosed)
+            state = stack.pop()
+            start = pop + 1
+        segments, state, unclosed = _trace(codes[start:stop], tables, *state)
+        pieces.append(segments)
+        stack.push(unclosed)
+        if stop < len(codes):
+            jump = tables.jumps[codes[stop]]
+            heading = state[2] if jump.heading is None else jump.heading
+            state = jump.x * fractals.w, jump.y * fractals.h, heading
+        start = stop + 1
+    return np.concatenate(pieces), state
+
+def iter_codes(path, chunk_size=CHUNK_SIZE):
+    """
+    Gather a stream of symbols into arrays of byte values.
+    """
+    path = iter(path)
+    while True:
+        chunk = "".join(islice(path, chunk_size))
+        if not chunk:
+            return
+        yield np.frombuffer(chunk.encode("ascii"), dtype=np.uint8)
+
+def iter_segments(fractal, iterations=None, chunk_size=CHUNK_SIZE,
+                  start=None):
+    """
+    Lazily generate arrays of the segments making up a fractal, one array per
+    chunk of symbols, so that memory use does not depend on the size of the
+    fractal. The fractal is drawn from start, as in trace_codes.
+    """
+    return trace_codes(expand_codes(fractal, iterations, chunk_size),
+                       fractal.draw_rules, start)
+
+def trace_codes(chunks, draw_rules, start=None):
+    """
+    Lazily trace a stream of arrays of byte values with the given draw rules,
+    generating an array of segments per chunk, from the same starting point as
+    draw_fractal unless another is given.
+    """
+    tables = compile_draw_rules(draw_rules)
+    state = start_state(start)
+    stack = StateStack()
+    for codes in chunks:
+        segments, state = trace_chunk(codes, tables, state, stack)
+        if len(segments):
+            yield segments
+
+def get_segments(fractal, iterations=None, chunk_size=CHUNK_SIZE):
+    """
+    Get all of the segments making up a fractal as one (n, 4) array.
+    """
+    return np.concatenate([np.zeros((0, 4)),
+                           *iter_segments(fractal, iterations, chunk_size)])
+
+def _to_pixel(coords):
+    """
+    Round coordinates to the nearest pixel. Fractals often land exactly on
+    half pixels, so coordinates are first snapped to a fine grid, to make sure
+    that tiny floating point differences all round the same way.
+    """
+    return np.floor(np.round(coords, 6) + 0.5)
+
+def rasterise(segments, image):
+    """
+    Draw segments onto a boolean image, by marking a pixel at every unit step
+    along each of them. The centre of the image is the origin, as on the turtle
+    canvas, and anything outside of the image is cut off. Points on the bottom
+    and right edges of the canvas round to just past the last row and column,
+    so they are drawn on those instead.
+    """
+    height, width = image.shape
+    x0, y0, x1, y1 = segments.T
+    steps = np.ceil(np.maximum(abs(x1 - x0), abs(y1 - y0))).astype(int) + 1
+    which = np.repeat(np.arange(len(segments)), steps)
+    offsets = np.arange(len(which)) - np.repeat(np.cumsum(steps) - steps, steps)
+    along = offsets / np.maximum(steps - 1, 1)[which]
+    cols = _to_pixel(x0[which] + along * (x1 - x0)[which] + width / 2)
+    rows = _to_pixel(height / 2 - y0[which] - along * (y1 - y0)[which])
+    inside = (cols >= 0) & (cols <= width) & (rows >= 0) & (rows <= height)
+    image[np.minimum(rows[inside], height - 1).astype(int),
+          np.minimum(cols[inside], width - 1).astype(int)] = True
+    return image
+
+def render(fractal, iterations=None, chunk_size=CHUNK_SIZE, start=None):
+    """
+    Rasterise a whole fractal onto an image the size of the canvas, drawn from
+    start, as in trace_codes.
+    """
+    image = np.zeros((fractals.h, fractals.w), dtype=bool)
+    for segments in iter_segments(fractal, iterations, chunk_size, start):
+        rasterise(segments, image)
+    return image
+
+if __name__ == "__main__":
+    args = get_args()
+    for fractal in FRACTAL_REGISTRY:
+        start = perf_counter()
+        segments = get_segments(fractal, args.iterations)
+        elapsed = perf_counter() - start
+        print("{}: {} segments in {:.3f}s ({:.0f} segments/s)"
+              .format(fractal.name, len(segments), elapsed,
+                      len(segments) / elapsed))
@@ -0,0 +1,220 @@
+"""
+Indexing into the expansions of the L-system fractals in fractals.py without
+actually carrying them out.
+
+Each fractal's rules give, for every symbol, how many of each symbol it expands
+into. Powers of this growth matrix give exact symbol counts at any iteration,
+and tables of the length of each symbol's expansion at each depth allow seeking
+straight to the nth symbol of an expansion, by descending through the rules
+one level at a time.
+"""
+
+from argparse import ArgumentParser
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate, chain
+
+from fractals import FRACTAL_REGISTRY, fractal_key, substitute
+
+def get_args():
+    """
+    Get the iteration count to report on
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than each default")
+    return parser.parse_args()
+
+def _mat_mul(a, b):
+    """
+    Multiply two square matrices, represented as lists of lists of (exact)
+    integers.
+    """
+    columns = list(zip(*b))
+    return [[sum(x * y for x, y in zip(row, col)) for col in columns]
+            for row in a]
+
+def _mat_pow(m, k):
+    """
+    Raise a square matrix to a non-negative integer power, by repeated squaring.
+    """
+    result = [[int(i == j) for j in range(len(m))] for i in range(len(m))]
+    while k:
+        if k & 1:
+            result = _mat_mul(result, m)
+        m = _mat_mul(m, m)
+        k >>= 1
+    return result
+
+class LSystemIndex:
+    """
+    Index over the expansions of one fractal. The table of expansion lengths is
+    built lazily, one depth at a time, as deeper expansions are asked about.
+    """
+    def __init__(self, fractal):
+        self.fractal = fractal
+        self.alphabet = sorted(set(chain(fractal.start, fractal.rules,
+                                         *fractal.rules.values())))
+        # lengths[d][s] is the length of the expansion of s after d iterations
+        self.lengths = [dict.fromkeys(self.alphabet, 1)]
+        # offsets[d][s] is the running total of lengths[d - 1] over the
+        # expansion of s by one iteration
+        self.offsets = [None]
+
+    def _iterations(self, iterations):
+        if iterations is None:
+            return self.fractal.iterations
+        if iterations < 0:
+            raise ValueError("cannot expand {} times".format(iterations))
+        return iterations
+
+    def _extend(self, depth):
+        rules = self.fractal.rules
+        while len(self.lengths) <= depth:
+            previous = self.lengths[-1]
+            offsets = {s: list(accumulate(previous[c] for c in rules[s]))
+                       for s in rules}
+            self.offsets.append(offsets)
+            self.lengths.append({s: offsets[s][-1] if s in offsets
+                                    and offsets[s] else int(s not in rules)
+                                 for s in self.alphabet})
+
+    def growth_matrix(self):
+        """
+        The matrix whose entry (i, j) is the number of occurrences of the jth
+        symbol of the alphabet in the expansion of the ith.
+        """
+        rules = self.fractal.rules
+        return [[Counter(rules[s])[c] if s in rules else int(s == c)
+                 for c in self.alphabet] for s in self.alphabet]
+
+    def symbol_counts(self, iterations=None):
+        """
+        Exactly count the occurrences of each symbol after a number of
+        iterations, in time logarithmic in the number of iterations.
+        """
+        power = _mat_pow(self.growth_matrix(), self._iterations(iterations))
+        start = Counter(self.fractal.start)
+        counts = [sum(start[s] * row[j] for s, row in zip(self.alphabet, power))
+                  for j in range(len(self.alphabet))]
+        return {s: c for s, c in zip(self.alphabet, counts) if c}
+
+    def length(self, iterations=None):
+        """
+        Length of the expansion after a number of iterations.
+        """
+        iterations = self._iterations(iterations)
+        self._extend(iterations)
+        return sum(self.lengths[iterations][s] for s in self.fractal.start)
+
+    def _locate(self, index, iterations):
+        """
+        Find which symbol of the start the nth symbol of the expansion comes
+        from, and how far into that symbol's expansion it is.
+        """
+        iterations = self._iterations(iterations)
+        self._extend(iterations)
+        length = self.length(iterations)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("expansion index out of range")
+        lengths = self.lengths[iterations]
+        for pos, symbol in enumerate(self.fractal.start):
+            if index < lengths[symbol]:
+                return iterations, pos, index
+            index -= lengths[symbol]
+        raise IndexError("expansion index out of range")
+
+    def _descend(self, symbol, depth, index):
+        """
+        Go down one level from the given symbol's expansion, returning the
+        position of the child containing the index and the index within it.
+        """
+        offsets = self.offsets[depth][symbol]
+        pos = bisect_right(offsets, index)
+        return pos, index - (offsets[pos - 1] if pos else 0)
+
+    def path(self, index, iterations=None):
+        """
+        Get the route down through the rules to the nth symbol of the
+        expansion, as a list of (sequence, position, depth) triples, starting
+        with the start of the fractal. The symbols of each sequence are
+        expanded depth more times, and the symbol at the given position is the
+        one expanded into the next sequence.
+        """
+        depth, pos, index = self._locate(index, iterations)
+        sequence = self.fractal.start
+        rules = self.fractal.rules
+        route = [(sequence, pos, depth)]
+        while depth and sequence[pos] in rules:
+            symbol = sequence[pos]
+            pos, index = self._descend(symbol, depth, index)
+            sequence = rules[symbol]
+            depth -= 1
+            route.append((sequence, pos, depth))
+        return route
+
+    def symbol_at(self, index, iterations=None):
+        """
+        Get the nth symbol of the expansion, in time proportional to the number
+        of iterations (and logarithmic in the length of each rule).
+        """
+        sequence, pos, _ = self.path(index, iterations)[-1]
+        return sequence[pos]
+
+    def expand_from(self, index, iterations=None):
+        """
+        Lazily generate the expansion starting from its nth symbol. Like
+        fractals.expand, this uses a stack of generators as deep as the number
+        of iterations.
+        """
+        depth, pos, index = self._locate(index, iterations)
+        return self._expand_from(self.fractal.start, pos, depth, index)
+
+    def _expand_from(self, sequence, pos, depth, index):
+        symbol = sequence[pos]
+        rules = self.fractal.rules
+        if depth and symbol in rules:
+            child, index = self._descend(symbol, depth, index)
+            yield from self._expand_from(rules[symbol], child, depth - 1, index)
+        else:
+            yield symbol
+        rest = sequence[pos + 1:]
+        for _ in range(depth):
+            rest = substitute(rest, rules)
+        yield from rest
+
+# registry to cache indices, keyed by fractal_key
+INDEX_REGISTRY = {}
+
+def get_index(fractal):
+    """
+    Get the index for a fractal, building and caching it if it hasn't been
+    built yet.
+    """
+    key = fractal_key(fractal)
+    if key not in INDEX_REGISTRY:
+        INDEX_REGISTRY[key] = LSystemIndex(fractal)
+    return INDEX_REGISTRY[key]
+
+def symbol_counts(fractal, iterations=None):
+    return get_index(fractal).symbol_counts(iterations)
+
+def expansion_length(fractal, iterations=None):
+    return get_index(fractal).length(iterations)
+
+def symbol_at(fractal, index, iterations=None):
+    return get_index(fractal).symbol_at(index, iterations)
+
+def expand_from(fractal, index, iterations=None):
+    return get_index(fractal).expand_from(index, iterations)
+
+if __name__ == "__main__":
+    args = get_args()
+    for fractal in FRACTAL_REGISTRY:
+        length = expansion_length(fractal, args.iterations)
+        print("{}: {} symbols, middle symbol {!r}"
+              .format(fractal.name, length,
+                      symbol_at(fractal, length // 2, args.iterations)))
+        print("    {}".format(symbol_counts(fractal, args.iterations)))
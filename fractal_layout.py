@@ -0,0 +1,188 @@
+"""
+Automatic scaling of the L-system fractals in fractals.py.
+
+The net effect of drawing the expansion of a symbol to some depth is a rigid
+motion of the turtle - a displacement and a change of heading - along with the
+shape of what was drawn. The shape is kept as its convex hull, which still
+gives the exact bounding box after any rotation, and which is small enough to
+be combined cheaply. These transforms are cached by (symbol, depth), and each
+is built from the transforms of the symbols of a rule one level down, so the
+bounds of an expansion can be found in time proportional to the number of
+iterations rather than the length of the expansion.
+
+Distances are measured in widths of the canvas, so a draw_fd(steps, size) rule
+moves steps / size.
+"""
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from math import cos, sin, radians
+
+from fractals import (FRACTAL_REGISTRY, Forward, Turn, Jump, save_state,
+                      restore_state, nop, fractal_key)
+
+# fraction of the canvas to leave empty around a fitted fractal
+MARGIN = 0.05
+
+Transform = namedtuple("Transform", "dx dy turn hull")
+Bounds = namedtuple("Bounds", "xmin ymin xmax ymax")
+
+IDENTITY = Transform(0, 0, 0, ((0, 0),))
+
+def get_args():
+    """
+    Get the iteration count to report on
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than each default")
+    return parser.parse_args()
+
+def convex_hull(points):
+    """
+    Convex hull of some points, anticlockwise, by Andrew's monotone chain.
+    """
+    points = sorted(set(points))
+    if len(points) < 3:
+        return tuple(points)
+    def half(points):
+        chain = []
+        for p in points:
+            while len(chain) >= 2 and ((chain[-1][0] - chain[-2][0])
+                                         * (p[1] - chain[-2][1])
+                                     - (chain[-1][1] - chain[-2][1])
+                                         * (p[0] - chain[-2][0])) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain[:-1]
+    return tuple(half(points) + half(reversed(points)))
+
+def get_bounds(points):
+    xs, ys = zip(*points)
+    return Bounds(min(xs), min(ys), max(xs), max(ys))
+
+class LayoutCache:
+    """
+    Cache of the transforms of the expansions of each symbol of one fractal.
+    """
+    def __init__(self, fractal):
+        self.fractal = fractal
+        self.transforms = {}
+
+    def _primitive(self, symbol):
+        """
+        Transform for a symbol which is drawn rather than expanded.
+        """
+        rule = self.fractal.draw_rules[symbol]
+        if isinstance(rule, Forward):
+            length = rule.steps / rule.size
+            return Transform(length, 0, 0, ((0, 0), (length, 0)))
+        elif isinstance(rule, Turn):
+            return Transform(0, 0, -rule.angle, ((0, 0),))
+        elif rule is nop:
+            return IDENTITY
+        raise ValueError("cannot find the transform of draw rule {!r} for {!r}"
+                         .format(rule, symbol))
+
+    def transform(self, symbol, depth):
+        """
+        Get the transform of a symbol expanded to some depth.
+        """
+        key = symbol, depth
+        if key not in self.transforms:
+            if depth and symbol in self.fractal.rules:
+                self.transforms[key] = self.trace(self.fractal.rules[symbol],
+                                                  depth - 1)
+            else:
+                self.transforms[key] = self._primitive(symbol)
+        return self.transforms[key]
+
+    def trace(self, sequence, depth, jumps=False):
+        """
+        Combine the transforms of a sequence of symbols, each expanded to some
+        depth. Saved states must be restored within the sequence, so that it
+        has a well-defined net effect. Jumps are only allowed if requested, and
+        then move back to the starting point, as the absolute positions they
+        normally jump to have no meaning here.
+        """
+        x = y = heading = 0
+        points = [(0, 0)]
+        stack = []
+        for symbol in sequence:
+            rule = self.fractal.draw_rules.get(symbol)
+            if rule is save_state:
+                stack.append((x, y, heading))
+            elif rule is restore_state:
+                if not stack:
+                    raise ValueError("unbalanced ] in {!r}".format(sequence))
+                x, y, heading = stack.pop()
+            elif isinstance(rule, Jump) and not (depth and symbol
+                                                 in self.fractal.rules):
+                if not jumps:
+                    raise ValueError("cannot find the transform of a jump")
+                x = y = 0
+                if rule.heading is not None:
+                    heading = rule.heading
+            else:
+                child = self.transform(symbol, depth)
+                c, s = cos(radians(heading)), sin(radians(heading))
+                points.extend((x + c * px - s * py, y + s * px + c * py)
+                              for px, py in child.hull)
+                x, y = (x + c * child.dx - s * child.dy,
+                        y + s * child.dx + c * child.dy)
+                heading += child.turn
+        if stack:
+            raise ValueError("unbalanced [ in {!r}".format(sequence))
+        return Transform(x, y, heading, convex_hull(points))
+
+    def bounds(self, iterations=None):
+        """
+        Bounding box of the whole fractal, starting from the origin facing
+        right.
+        """
+        if iterations is None:
+            iterations = self.fractal.iterations
+        return get_bounds(self.trace(self.fractal.start, iterations,
+                                     jumps=True).hull)
+
+# registry to cache layouts, keyed by fractal_key
+LAYOUT_REGISTRY = {}
+
+def get_layout(fractal):
+    """
+    Get the layout cache for a fractal, creating it if necessary.
+    """
+    key = fractal_key(fractal)
+    if key not in LAYOUT_REGISTRY:
+        LAYOUT_REGISTRY[key] = LayoutCache(fractal)
+    return LAYOUT_REGISTRY[key]
+
+def fit_fractal(fractal, width, height, iterations=None):
+    """
+    Rescale a fractal to fill a canvas of the given size, centred on it. Returns
+    a copy of the fractal with adjusted draw rules, and the point to start
+    drawing it from.
+    """
+    if iterations is None:
+        iterations = fractal.iterations
+    bounds = get_layout(fractal).bounds(iterations)
+    span = max(bounds.xmax - bounds.xmin,
+               (bounds.ymax - bounds.ymin) * width / height)
+    scale = (1 - 2 * MARGIN) / span if span else 1
+    start = (-scale * width * (bounds.xmin + bounds.xmax) / 2,
+             -scale * width * (bounds.ymin + bounds.ymax) / 2)
+    draw_rules = {}
+    for symbol, rule in fractal.draw_rules.items():
+        if isinstance(rule, Forward):
+            rule = Forward(rule.steps * scale, rule.size)
+        elif isinstance(rule, Jump):
+            rule = Jump(start[0] / width, start[1] / height, rule.heading)
+        draw_rules[symbol] = rule
+    return fractal._replace(draw_rules=draw_rules,
+                            iterations=iterations), start
+
+if __name__ == "__main__":
+    args = get_args()
+    for fractal in FRACTAL_REGISTRY:
+        print("{}: {}".format(fractal.name,
+                              get_layout(fractal).bounds(args.iterations)))
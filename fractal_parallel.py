@@ -0,0 +1,148 @@
+"""
+Rendering the L-system fractals in fractals.py on several cores at once.
+
+The expansion of a fractal is split into contiguous chunks of symbols. The
+turtle state at the start of each chunk - position, heading and saved states -
+is worked out directly, by walking down through the rules to the chunk's first
+symbol (see fractal_index.py) and adding up the cached transforms of everything
+before it on the way (see fractal_layout.py). Each chunk can then be expanded
+and rasterised by a separate process, and the images are combined at the end.
+"""
+
+from argparse import ArgumentParser
+from math import cos, sin, radians
+from multiprocessing import Pool, cpu_count
+from time import perf_counter
+
+import numpy as np
+
+import fractals
+from fractals import (FRACTAL_REGISTRY, Jump, save_state, restore_state,
+                      _LSystemFractal)
+from fractal_geometry import (CHUNK_SIZE, StateStack, compile_rules,
+                              compile_draw_rules, expand_sequence_codes,
+                              trace_chunk, rasterise, render)
+from fractal_index import get_index
+from fractal_layout import get_layout
+
+# number of chunks to hand to each process, so that uneven chunks even out
+CHUNKS_PER_PROCESS = 4
+
+def get_args():
+    """
+    Get parameters for a timing run over the registry
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than each default")
+    parser.add_argument("-p", "--processes", type=int, default=cpu_count(),
+                    help="number of worker processes")
+    parser.add_argument("--serial", action="store_true",
+                    help="also time rendering in a single process")
+    return parser.parse_args()
+
+def state_at(fractal, index, iterations=None):
+    """
+    Find the turtle state just before the nth symbol of the expansion is drawn,
+    in the canvas coordinates used by fractal_geometry.py. Returns the position
+    and heading, and an array of the states saved by still unmatched [ symbols.
+    """
+    layout = get_layout(fractal)
+    rules = fractal.rules
+    x, y, heading = -fractals.w / 2, -fractals.h / 2, 0
+    stack = []
+    for sequence, pos, depth in get_index(fractal).path(index, iterations):
+        for symbol in sequence[:pos]:
+            rule = fractal.draw_rules.get(symbol)
+            if rule is save_state:
+                stack.append((x, y, heading))
+            elif rule is restore_state:
+                x, y, heading = stack.pop()
+            elif isinstance(rule, Jump) and not (depth and symbol in rules):
+                x, y = rule.x * fractals.w, rule.y * fractals.h
+                if rule.heading is not None:
+                    heading = rule.heading
+            else:
+                child = layout.transform(symbol, depth)
+                c, s = cos(radians(heading)), sin(radians(heading))
+                x += fractals.w * (c * child.dx - s * child.dy)
+                y += fractals.w * (s * child.dx + c * child.dy)
+                heading += child.turn
+    return (x, y, heading), np.array(stack).reshape(-1, 3)
+
+def expand_between(fractal, start, stop, iterations=None,
+                   chunk_size=CHUNK_SIZE):
+    """
+    Lazily expand the symbols of a fractal from the nth up to (but not
+    including) the stopth, as arrays of byte values of at most chunk_size. The
+    rest of each sequence on the route down to the nth symbol is expanded in
+    turn, from the bottom up, with the vectorised rules of fractal_geometry.py,
+    and nothing is expanded beyond stop.
+    """
+    tables = compile_rules(fractal.rules)
+    route = get_index(fractal).path(start, iterations)
+    remaining = stop - start
+    for level, (sequence, pos, depth) in enumerate(reversed(route)):
+        # the bottom of the route includes the nth symbol itself
+        rest = sequence[pos:] if level == 0 else sequence[pos + 1:]
+        for codes in expand_sequence_codes(rest, tables, depth, chunk_size):
+            if remaining <= len(codes):
+                if remaining:
+                    yield codes[:remaining]
+                return
+            remaining -= len(codes)
+            yield codes
+
+def _render_chunk(task):
+    """
+    Expand and rasterise one chunk of a fractal. This runs in a worker process,
+    so the fractal is passed as a plain tuple of its fields.
+    """
+    fields, iterations, start, stop, chunk_size, size = task
+    fractal = _LSystemFractal(*fields)
+    fractals.w, fractals.h = size
+    state, saved = state_at(fractal, start, iterations)
+    tables = compile_draw_rules(fractal.draw_rules)
+    stack = StateStack(saved)
+    image = np.zeros((fractals.h, fractals.w), dtype=bool)
+    for codes in expand_between(fractal, start, stop, iterations, chunk_size):
+        segments, state = trace_chunk(codes, tables, state, stack)
+        rasterise(segments, image)
+    return np.packbits(image)
+
+def render_parallel(fractal, iterations=None, processes=None, chunks=None,
+                    chunk_size=CHUNK_SIZE):
+    """
+    Rasterise a whole fractal onto an image the size of the canvas, splitting
+    the work between a pool of processes. The result is the same as that of
+    fractal_geometry.render.
+    """
+    if processes is None:
+        processes = cpu_count()
+    if chunks is None:
+        chunks = processes * CHUNKS_PER_PROCESS
+    length = get_index(fractal).length(iterations)
+    bounds = [length * i // chunks for i in range(chunks + 1)]
+    tasks = [(tuple(fractal), iterations, start, stop, chunk_size,
+              (fractals.w, fractals.h))
+             for start, stop in zip(bounds, bounds[1:]) if start < stop]
+    image = np.zeros(fractals.h * fractals.w, dtype=bool)
+    with Pool(processes) as pool:
+        for packed in pool.imap_unordered(_render_chunk, tasks):
+            image |= np.unpackbits(packed, count=len(image)).astype(bool)
+    return image.reshape(fractals.h, fractals.w)
+
+if __name__ == "__main__":
+    args = get_args()
+    for fractal in FRACTAL_REGISTRY:
+        start = perf_counter()
+        image = render_parallel(fractal, args.iterations, args.processes)
+        elapsed = perf_counter() - start
+        message = "{}: {} pixels in {:.3f}s".format(fractal.name, image.sum(),
+                                                    elapsed)
+        if args.serial:
+            start = perf_counter()
+            same = (render(fractal, args.iterations) == image).all()
+            message += ", {:.3f}s serially ({})".format(
+                perf_counter() - start, "same" if same else "different")
+        print(message)
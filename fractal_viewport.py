@@ -0,0 +1,195 @@
+"""
+Zoomed-in rendering of the L-system fractals in fractals.py.
+
+Rather than expanding the whole fractal, the expansion is walked as a tree,
+using the cached transforms of each (symbol, depth) from fractal_layout.py.
+Subtrees whose bounds fall outside of the visible window are skipped in one
+step, and subtrees which are smaller than a pixel are drawn as a single
+segment from where they start to where they end, so the work done depends on
+how much detail is visible rather than on the length of the expansion.
+"""
+
+from argparse import ArgumentParser
+from collections import namedtuple
+from math import cos, sin, radians
+from time import perf_counter
+
+import numpy as np
+
+import fractals
+from fractals import (FRACTAL_REGISTRY, Forward, Jump, save_state,
+                      restore_state)
+from fractal_export import write_png
+from fractal_geometry import rasterise
+from fractal_layout import get_layout, fit_fractal
+
+# number of segments to rasterise at once
+BATCH_SIZE = 1 << 14
+
+# visible window, by its centre and size in canvas coordinates
+Viewport = namedtuple("Viewport", "x y width height")
+
+def get_args():
+    """
+    Get the fractal and window to render
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("fractal", type=int,
+                    help="index of the fractal in the registry")
+    parser.add_argument("output", help="PNG file to write")
+    parser.add_argument("-i", "--iterations", type=int,
+                    help="number of iterations, rather than the default")
+    parser.add_argument("-z", "--zoom", type=float, default=1,
+                    help="magnification of the fitted fractal")
+    parser.add_argument("-c", "--centre", type=float, nargs=2, default=(0, 0),
+                    help="point to zoom in on, in canvas coordinates")
+    return parser.parse_args()
+
+class ViewportWalker:
+    """
+    Walks the expansion of a fractal, generating the segments which are
+    visible in a viewport, down to a given pixel size.
+    """
+    def __init__(self, fractal, viewport, pixel):
+        self.fractal = fractal
+        self.layout = get_layout(fractal)
+        self.pixel = pixel
+        self.xmin = viewport.x - viewport.width / 2
+        self.xmax = viewport.x + viewport.width / 2
+        self.ymin = viewport.y - viewport.height / 2
+        self.ymax = viewport.y + viewport.height / 2
+        # count of subtrees skipped or drawn without being expanded
+        self.culled = 0
+
+    def walk(self, iterations=None, start=None):
+        """
+        Lazily generate the visible segments, as (x0, y0, x1, y1) tuples,
+        starting from the bottom left of the canvas like draw_fractal unless
+        another starting point is given.
+        """
+        if iterations is None:
+            iterations = self.fractal.iterations
+        x, y = start or (-fractals.w / 2, -fractals.h / 2)
+        return self._walk_sequence(self.fractal.start, iterations, x, y, 0)
+
+    def _walk_sequence(self, sequence, depth, x, y, heading):
+        """
+        Walk each symbol of a sequence, expanded to some depth. Returns the
+        final state once all of its segments have been generated.
+        """
+        stack = []
+        for symbol in sequence:
+            rule = self.fractal.draw_rules.get(symbol)
+            if rule is save_state:
+                stack.append((x, y, heading))
+            elif rule is restore_state:
+                x, y, heading = stack.pop()
+            elif isinstance(rule, Jump) and not (depth and symbol
+                                                 in self.fractal.rules):
+                x, y = rule.x * fractals.w, rule.y * fractals.h
+                if rule.heading is not None:
+                    heading = rule.heading
+            else:
+                x, y, heading = yield from self._walk_symbol(symbol, depth, x,
+                                                             y, heading)
+        return x, y, heading
+
+    def _walk_symbol(self, symbol, depth, x, y, heading):
+        transform = self.layout.transform(symbol, depth)
+        c = fractals.w * cos(radians(heading))
+        s = fractals.w * sin(radians(heading))
+        end = (x + c * transform.dx - s * transform.dy,
+               y + s * transform.dx + c * transform.dy,
+               heading + transform.turn)
+        xs = [x + c * px - s * py for px, py in transform.hull]
+        ys = [y + s * px + c * py for px, py in transform.hull]
+        if (max(xs) < self.xmin or min(xs) > self.xmax
+                or max(ys) < self.ymin or min(ys) > self.ymax):
+            self.culled += 1
+            return end
+        expands = depth and symbol in self.fractal.rules
+        if expands and max(max(xs) - min(xs), max(ys) - min(ys)) < self.pixel:
+            self.culled += 1
+            if len(transform.hull) > 1:
+                yield x, y, end[0], end[1]
+            return end
+        if expands:
+            yield from self._walk_sequence(self.fractal.rules[symbol],
+                                           depth - 1, x, y, heading)
+        elif isinstance(self.fractal.draw_rules[symbol], Forward):
+            yield x, y, end[0], end[1]
+        return end
+
+def render_viewport(fractal, viewport, size=None, iterations=None,
+                    pixel=None, start=None):
+    """
+    Rasterise the part of a fractal inside a viewport onto an image of the
+    given (width, height), by default the size of the canvas. Subtrees are only
+    expanded while they are bigger than pixel, by default one pixel of the
+    image. The fractal is drawn from start, as in ViewportWalker.walk. Returns
+    the image and the walker, which has some statistics.
+    """
+    width, height = size or (fractals.w, fractals.h)
+    scale = min(width / viewport.width, height / viewport.height)
+    # segments just outside of the viewport can still round onto its edge, so
+    # only cull beyond a pixel's margin
+    margin = 2 / scale
+    walker = ViewportWalker(fractal,
+                            viewport._replace(width=viewport.width + margin,
+                                              height=viewport.height + margin),
+                            1 / scale if pixel is None else pixel)
+    image = np.zeros((height, width), dtype=bool)
+    batch = []
+    for segment in walker.walk(iterations, start):
+        batch.append(segment)
+        if len(batch) == BATCH_SIZE:
+            _rasterise_batch(batch, viewport, scale, image)
+            batch = []
+    _rasterise_batch(batch, viewport, scale, image)
+    return image, walker
+
+def clip_segments(segments, xmax, ymax):
+    """
+    Clip an (n, 4) array of segments to the rectangle from (-xmax, -ymax) to
+    (xmax, ymax), by the Liang-Barsky algorithm, dropping those which miss it
+    entirely.
+    """
+    x0, y0, x1, y1 = segments.T
+    dx, dy = x1 - x0, y1 - y0
+    # each edge of the rectangle limits how far along the segment can go, from
+    # whichever end is outside of it
+    p = np.stack([-dx, dx, -dy, dy])
+    q = np.stack([x0 + xmax, xmax - x0, y0 + ymax, ymax - y0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = q / p
+    start = np.max(np.where(p < 0, t, 0), axis=0)
+    end = np.min(np.where(p > 0, t, 1), axis=0)
+    # segments parallel to an edge and outside of it never enter
+    keep = (start <= end) & ~((p == 0) & (q < 0)).any(axis=0)
+    start, end = start[keep, None], end[keep, None]
+    first, delta = segments[keep, :2], np.stack([dx, dy], axis=1)[keep]
+    return np.hstack([first + start * delta, first + end * delta])
+
+def _rasterise_batch(batch, viewport, scale, image):
+    if batch:
+        segments = np.array(batch)
+        segments -= (viewport.x, viewport.y, viewport.x, viewport.y)
+        # only step along the parts of segments which are in the image, plus
+        # a pixel, so that the work doesn't grow with the zoom
+        height, width = image.shape
+        segments = clip_segments(segments, (width / 2 + 1) / scale,
+                                 (height / 2 + 1) / scale)
+        rasterise(segments * scale, image)
+
+if __name__ == "__main__":
+    args = get_args()
+    fractal, start = fit_fractal(FRACTAL_REGISTRY[args.fractal], fractals.w,
+                             fractals.h, args.iterations)
+    viewport = Viewport(*args.centre, fractals.w / args.zoom,
+                        fractals.h / args.zoom)
+    begin = perf_counter()
+    image, walker = render_viewport(fractal, viewport, start=start)
+    print("{} pixels in {:.3f}s, {} subtrees culled".format(
+        image.sum(), perf_counter() - begin, walker.culled))
+    with open(args.output, "wb") as f:
+        write_png(image, f)
@@ -6,18 +6,17 @@ using a call-stack of the size of the number of iterations. See [1].
 For a version in Python-processing, see
 https://github.com/goedel-gang/lsystems
 
+To draw them, run fractal_draw.py.
+
 [1]: https://en.wikipedia.org/wiki/L-system
 """
 
-import turtle as t
-
-# set the turtle speed to be very fast
-t.speed(0)
-w, h = t.screensize()
-print(w, h)
-
 from collections import namedtuple
+from itertools import chain
 from math import cos, radians
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from time import perf_counter
 
 # global constants
 SIERP_ITERATIONS = 6
@@ -30,6 +29,27 @@ KOCH_SQUARE_ITERATIONS = 5
 KOCH_ITERATIONS = 5
 ARERA_ITERATIONS = 6
 
+# number of symbols expanded at once by expand_chunks. This bounds the memory
+# used at each level of expansion.
+CHUNK_SIZE = 1 << 16
+
+# number of turtle commands to draw between screen updates. Updating the screen
+# after every single command is by far the slowest part of drawing.
+FRAME_INTERVAL = 200
+
+# parameters for drawing with a DrawPipeline: the number of turtle commands
+# passed from the expanding thread to Tk at once, the number of such batches
+# which can be waiting, and the longest Tk spends drawing before it updates the
+# screen and handles events (in seconds)
+BATCH_SIZE = 256
+QUEUE_SIZE = 64
+FRAME_TIME = 0.02
+
+# dimensions of the canvas. These start out as turtle's defaults, so that the
+# fractals can be laid out without a display, and are replaced by the real
+# values once setup_screen has been called.
+w, h = 400, 300
+
 _LSystemFractal = namedtuple("LSystemFractal",
                              "name start rules draw_rules iterations")
 
@@ -40,6 +60,15 @@ def LSystemFractal(*args, **kwargs):
     FRACTAL_REGISTRY.append(lsf)
     return lsf
 
+def fractal_key(fractal):
+    """
+    Hashable key describing what a fractal draws, for use by caches. Fractals
+    themselves hold dictionaries, so cannot be hashed, and copies of them with
+    different draw rules (see fractal_layout.py) share their name.
+    """
+    return (fractal.start, tuple(sorted(fractal.rules.items())),
+            tuple(sorted(fractal.draw_rules.items(), key=lambda i: i[0])))
+
 def substitute(sequence, rules):
     for symbol in sequence:
         if symbol not in rules:
@@ -47,10 +76,68 @@ def substitute(sequence, rules):
         else:
             yield from rules[symbol]
 
+# the turtle module, which is only imported once something is drawn, as it is
+# slow to import and needs Tk
+t = None
+screen_ready = False
+
+def setup_screen():
+    """
+    Create the turtle screen, if this hasn't happened yet. This is deferred
+    until something is actually drawn, so that the definitions in this module
+    can be used on a machine without a display.
+    """
+    global t, w, h, screen_ready
+    if not screen_ready:
+        import turtle as t
+        # set the turtle speed to be very fast
+        t.speed(0)
+        w, h = t.screensize()
+        print(w, h)
+        screen_ready = True
+
+class Forward(namedtuple("Forward", "steps size")):
+    """
+    Draw rule moving forward by steps / size of the width of the canvas. Draw
+    rules are plain callables, but describing them as data means that they can
+    also be interpreted without a turtle (see fractal_geometry.py).
+    """
+    __slots__ = ()
+
+    def __call__(self):
+        t.forward(self.steps * w / self.size)
+
+class Turn(namedtuple("Turn", "angle")):
+    """
+    Draw rule turning right by angle degrees.
+    """
+    __slots__ = ()
+
+    def __call__(self):
+        t.right(self.angle)
+
+class Jump(namedtuple("Jump", "x y heading")):
+    """
+    Draw rule moving to a point without drawing, given as a fraction of the
+    canvas size relative to its centre, and optionally setting the heading.
+    """
+    __slots__ = ()
+
+    def __call__(self):
+        t.penup()
+        t.setpos(self.x * w, self.y * h)
+        if self.heading is not None:
+            t.setheading(self.heading)
+        t.pendown()
+
 def draw_fd(steps, size):
-    def f():
-        t.forward(steps * w / size)
-    return f
+    return Forward(steps, size)
+
+def draw_rt(angle):
+    return Turn(angle)
+
+def draw_jump(x, y, heading=None):
+    return Jump(x, y, heading)
 
 STATE_STACK = []
 
@@ -74,8 +161,8 @@ sierpinski = LSystemFractal(
      "G": "GG"},
     {"F": draw_fd(1, 2 ** SIERP_ITERATIONS),
      "G": draw_fd(1, 2 ** SIERP_ITERATIONS),
-     "-": lambda: t.right(-120),
-     "+": lambda: t.right(+120)},
+     "-": draw_rt(-120),
+     "+": draw_rt(+120)},
     SIERP_ITERATIONS)
 
 dragon = LSystemFractal(
@@ -84,9 +171,9 @@ dragon = LSystemFractal(
     {"X": "X+YF+",
      "Y": "-FX-Y"},
     {"F": draw_fd(1, 2 * 2 ** (DRAGON_ITERATIONS / 2)),
-     "-": lambda: t.right(+90),
-     "+": lambda: t.right(-90),
-     "0": lambda: [t.penup(), t.setpos(0, 0), t.pendown()],
+     "-": draw_rt(+90),
+     "+": draw_rt(-90),
+     "0": draw_jump(0, 0),
      "X": nop,
      "Y": nop},
     DRAGON_ITERATIONS)
@@ -97,13 +184,12 @@ fern = LSystemFractal(
     {"X": "F+[[X]-X]-F[-FX]+X",
      "F": "FF"},
     {"F": draw_fd(1, 3 ** (FERN_ITERATIONS - 1)),
-     "-": lambda: t.right(+25),
-     "+": lambda: t.right(-25),
+     "-": draw_rt(+25),
+     "+": draw_rt(-25),
      "X": nop,
      "[": save_state,
      "]": restore_state,
-     "0": lambda: [t.penup(), t.setpos(0, -h / 2),
-                   t.setheading(90), t.pendown()]},
+     "0": draw_jump(0, -1 / 2, 90)},
     FERN_ITERATIONS)
 
 levy_c = LSystemFractal(
@@ -111,8 +197,8 @@ levy_c = LSystemFractal(
     "F",
     {"F": "+F--F+"},
     {"F": draw_fd(1, 2 ** (LEVY_ITERATIONS / 2)),
-     "-": lambda: t.right(+45),
-     "+": lambda: t.right(-45)},
+     "-": draw_rt(+45),
+     "+": draw_rt(-45)},
     LEVY_ITERATIONS)
 
 hilbert = LSystemFractal(
@@ -123,8 +209,8 @@ hilbert = LSystemFractal(
     {"F": draw_fd(1, 2 ** (HILBERT_ITERATIONS)),
      "A": nop,
      "B": nop,
-     "-": lambda: t.right(-90),
-     "+": lambda: t.right(+90)},
+     "-": draw_rt(-90),
+     "+": draw_rt(+90)},
     HILBERT_ITERATIONS)
 
 sierp_hex = LSystemFractal(
@@ -134,8 +220,8 @@ sierp_hex = LSystemFractal(
      "B": "A+B+A"},
     {"A": draw_fd(1, 2 ** SIERP_HEX_ITERATIONS),
      "B": draw_fd(1, 2 ** SIERP_HEX_ITERATIONS),
-     "-": lambda: t.right(-60),
-     "+": lambda: t.right(+60)},
+     "-": draw_rt(-60),
+     "+": draw_rt(+60)},
     SIERP_HEX_ITERATIONS)
 
 koch = LSystemFractal(
@@ -143,8 +229,8 @@ koch = LSystemFractal(
     "F--F--F",
     {"F": "F+F--F+F"},
     {"F": draw_fd(1, 3 ** KOCH_ITERATIONS),
-     "-": lambda: t.right(-60),
-     "+": lambda: t.right(+60)},
+     "-": draw_rt(-60),
+     "+": draw_rt(+60)},
     KOCH_ITERATIONS)
 
 koch_square = LSystemFractal(
@@ -152,8 +238,8 @@ koch_square = LSystemFractal(
     "F",
     {"F": "F+F-F-F+F"},
     {"F": draw_fd(1, 3 ** (KOCH_ITERATIONS)),
-     "-": lambda: t.right(+90),
-     "+": lambda: t.right(-90)},
+     "-": draw_rt(+90),
+     "+": draw_rt(-90)},
     KOCH_SQUARE_ITERATIONS)
 
 arera_lighthouse = LSystemFractal(
@@ -163,9 +249,9 @@ arera_lighthouse = LSystemFractal(
      "G": "GG"},
     {"F": draw_fd(1, 2 ** ARERA_ITERATIONS),
      "G": draw_fd(1, 2 ** ARERA_ITERATIONS),
-     "-": lambda: t.right(+127),
-     "+": lambda: t.right(-127),
-     "0": lambda: t.right(180)},
+     "-": draw_rt(+127),
+     "+": draw_rt(-127),
+     "0": draw_rt(180)},
     ARERA_ITERATIONS)
 
 arera_spread = LSystemFractal(
@@ -175,36 +261,204 @@ arera_spread = LSystemFractal(
      "G": "GG"},
     {"F": draw_fd(1, (1 / -cos(radians(117))) ** ARERA_ITERATIONS),
      "G": draw_fd(1, (1 / -cos(radians(117))) ** ARERA_ITERATIONS),
-     "-": lambda: t.right(-117),
-     "+": lambda: t.right(+117)},
+     "-": draw_rt(-117),
+     "+": draw_rt(+117)},
     ARERA_ITERATIONS)
 
-def draw_fractal(fractal):
-    t.setpos(-w / 2, -h / 2)
+def expand(fractal, iterations=None):
+    """
+    Lazily expand the start of a fractal by its rules, by default as many times
+    as the fractal asks for.
+    """
+    if iterations is None:
+        iterations = fractal.iterations
+    path = fractal.start
+    for _ in range(iterations):
+        path = substitute(path, fractal.rules)
+    return path
+
+def _translate_chunks(chunks, table, chunk_size):
+    for chunk in chunks:
+        chunk = chunk.translate(table)
+        for i in range(0, len(chunk), chunk_size):
+            yield chunk[i:i + chunk_size]
+
+def expand_chunks(fractal, iterations=None, chunk_size=CHUNK_SIZE):
+    """
+    Lazily expand a fractal like expand, but as a stream of strings of at most
+    chunk_size symbols. The rules are compiled into a translation table, so
+    that each chunk is substituted in one str.translate call, rather than one
+    symbol at a time through a generator per iteration. Memory use is still
+    bounded, by about chunk_size times the number of iterations.
+    """
+    if iterations is None:
+        iterations = fractal.iterations
+    table = str.maketrans(fractal.rules)
+    chunks = [fractal.start[i:i + chunk_size]
+              for i in range(0, len(fractal.start), chunk_size)]
+    for _ in range(iterations):
+        chunks = _translate_chunks(chunks, table, chunk_size)
+    return chunks
+
+def expand_fast(fractal, iterations=None, chunk_size=CHUNK_SIZE):
+    """
+    Lazily expand a fractal symbol by symbol, using expand_chunks.
+    """
+    return chain.from_iterable(expand_chunks(fractal, iterations, chunk_size))
+
+def optimise_rules(symbols, draw_rules):
+    """
+    Lazily translate a stream of symbols into the draw rules to call, as a
+    peephole optimiser: runs of forward moves are merged into one move, runs of
+    turns into one turn, and symbols which do nothing are dropped.
+    """
+    pending = None
+    for symbol in symbols:
+        rule = draw_rules[symbol]
+        if rule is nop:
+            continue
+        if isinstance(rule, Forward) and isinstance(pending, Forward):
+            pending = Forward(pending.steps / pending.size
+                              + rule.steps / rule.size, 1)
+        elif isinstance(rule, Turn) and isinstance(pending, Turn):
+            pending = Turn(pending.angle + rule.angle)
+        else:
+            if pending is not None and pending != Turn(0):
+                yield pending
+            pending = rule
+    if pending is not None and pending != Turn(0):
+        yield pending
+
+def prepare_drawing(fractal, iterations=None, fit=False, cache=False):
+    """
+    Set up the screen and turtle to draw a fractal, and return a lazy stream of
+    the draw rules to call to draw it. See draw_fractal for the parameters.
+    """
+    setup_screen()
+    start = -w / 2, -h / 2
+    if fit:
+        from fractal_layout import fit_fractal
+        fractal, start = fit_fractal(fractal, w, h, iterations)
+    t.penup()
+    t.setpos(*start)
     t.setheading(0)
     t.clear()
     t.pendown()
-    path = fractal.start
-    for _ in range(fractal.iterations):
-        path = substitute(path, fractal.rules)
-    for symbol in path:
-        fractal.draw_rules[symbol]()
-
-if __name__ == "__main__":
-    while True:
-        print("Available fractals:")
-        print("\n".join(
-            "{}: {}".format(ind, i.name)
-            for ind, i in enumerate(FRACTAL_REGISTRY)))
-        result = input("Enter number of fractal > ")
-        try:
-            result = int(result)
-            if not (0 <= result < len(FRACTAL_REGISTRY)):
-                raise ValueError("outside of range")
+    if cache:
+        from fractal_cache import cached_expansion
+        symbols = cached_expansion(fractal, iterations)
+    else:
+        symbols = expand_fast(fractal, iterations)
+    return optimise_rules(symbols, fractal.draw_rules)
+
+def draw_fractal(fractal, iterations=None, fit=False,
+                 frame_interval=FRAME_INTERVAL, cache=False):
+    """
+    Draw a fractal with the turtle. If fit is set, the fractal is scaled and
+    centred to fill the canvas (see fractal_layout.py), rather than relying on
+    its hand-tuned sizes. The screen is only updated every frame_interval
+    commands, or after every command if this is 0. If cache is set, the
+    expansion is read from (and if need be stored in) the on-disk cache (see
+    fractal_cache.py).
+    """
+    commands = prepare_drawing(fractal, iterations, fit, cache)
+    t.tracer(0 if frame_interval else 1)
+    try:
+        for count, rule in enumerate(commands, 1):
+            rule()
+            if frame_interval and not count % frame_interval:
+                t.update()
+    finally:
+        t.update()
+
+class DrawPipeline:
+    """
+    Draws a stream of turtle commands without blocking Tk. A background thread
+    consumes the stream - which is where the expansion happens - and passes
+    batches of commands through a bounded queue, while the Tk event loop drains
+    the queue from a timer, drawing for at most FRAME_TIME at a time. The
+    window stays responsive, and cancelling stops both sides within a frame.
+    """
+    def __init__(self, commands, batch_size=BATCH_SIZE, queue_size=QUEUE_SIZE,
+                 frame_time=FRAME_TIME):
+        self.batch_size = batch_size
+        self.frame_time = frame_time
+        self.queue = Queue(queue_size)
+        self.cancelled = Event()
+        self.finished = Event()
+        self.producer = Thread(target=self._produce, args=(commands,),
+                               daemon=True)
+
+    def start(self):
+        """
+        Start drawing. This returns straight away, and the drawing happens
+        while the Tk event loop runs.
+        """
+        t.tracer(0)
+        self.producer.start()
+        t.ontimer(self._drain, 0)
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def done(self):
+        return self.cancelled.is_set() or self.finished.is_set()
+
+    def wait(self):
+        """
+        Run the Tk event loop until drawing has finished or been cancelled,
+        rather than until the window is closed like turtle.done.
+        """
+        while not self.done():
+            t.update()
+            self.cancelled.wait(self.frame_time / 10)
+
+    def _put(self, item):
+        """
+        Put an item on the queue, giving up if cancelled while waiting for
+        space.
+        """
+        while not self.cancelled.is_set():
             try:
-                print("Press Ctrl+C to interrupt")
-                draw_fractal(FRACTAL_REGISTRY[result])
-            except KeyboardInterrupt:
+                self.queue.put(item, timeout=self.frame_time)
+                return True
+            except Full:
                 pass
-        except ValueError as ve:
-            print("error: {}".format(ve))
+        return False
+
+    def _produce(self, commands):
+        batch = []
+        for command in commands:
+            batch.append(command)
+            if len(batch) == self.batch_size:
+                if not self._put(batch):
+                    return
+                batch = []
+        # None marks the end of the stream
+        self._put(batch) and self._put(None)
+
+    def _drain(self):
+        deadline = perf_counter() + self.frame_time
+        while not self.cancelled.is_set() and perf_counter() < deadline:
+            try:
+                batch = self.queue.get_nowait()
+            except Empty:
+                break
+            if batch is None:
+                self.finished.set()
+                break
+            for command in batch:
+                command()
+        t.update()
+        if not self.done():
+            t.ontimer(self._drain, 1)
+
+def draw_fractal_pipelined(fractal, iterations=None, fit=False, cache=False):
+    """
+    Start drawing a fractal in the background of the Tk event loop, using a
+    DrawPipeline, which is returned so that it can be cancelled. See
+    draw_fractal for the parameters.
+    """
+    pipeline = DrawPipeline(prepare_drawing(fractal, iterations, fit, cache))
+    pipeline.start()
+    return pipeline
@@ -30,3 +30,96 @@ class State(Enum):
     X_WIN = 1
     O_WIN = 2
     NEUTRAL = 3
+
+class BitBoard:
+    """
+    A board stored as a pair of integers, one for each player, where bit i is
+    set if they have played in position i. It behaves like the usual list of
+    None, True and False, so it can be used wherever a board can, but the
+    functions in checking.py and computer.py recognise it and work on whole
+    groups at once with bitwise operations.
+    """
+    __slots__ = ["crosses", "noughts", "size"]
+
+    def __init__(self, board=()):
+        self.size = len(board)
+        self.crosses = self.noughts = 0
+        for pos, tile in enumerate(board):
+            self[pos] = tile
+
+    def empty(self):
+        """
+        Get the mask of empty positions.
+        """
+        return ((1 << self.size) - 1) & ~(self.crosses | self.noughts)
+
+    def empty_positions(self):
+        """
+        Generate the empty positions, in order, from the empty mask - one bit
+        operation per position rather than looking at every tile.
+        """
+        empty = self.empty()
+        while empty:
+            bit = empty & -empty
+            yield bit.bit_length() - 1
+            empty ^= bit
+
+    def play(self, pos, is_crosses):
+        """
+        Play in an empty position - cheaper than assigning to it.
+        """
+        if is_crosses:
+            self.crosses |= 1 << pos
+        else:
+            self.noughts |= 1 << pos
+
+    def unplay(self, pos):
+        """
+        Empty a position again, undoing play.
+        """
+        self.crosses &= ~(1 << pos)
+        self.noughts &= ~(1 << pos)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, pos):
+        if not 0 <= pos < self.size:
+            raise IndexError("board index out of range")
+        if self.crosses >> pos & 1:
+            return True
+        if self.noughts >> pos & 1:
+            return False
+        return None
+
+    def __setitem__(self, pos, tile):
+        if not 0 <= pos < self.size:
+            raise IndexError("board index out of range")
+        bit = 1 << pos
+        self.crosses &= ~bit
+        self.noughts &= ~bit
+        if tile is True:
+            self.crosses |= bit
+        elif tile is False:
+            self.noughts |= bit
+
+    def __iter__(self):
+        return map(self.__getitem__, range(self.size))
+
+    def count(self, tile):
+        if tile is None:
+            return bin(self.empty()).count("1")
+        return bin(self.crosses if tile else self.noughts).count("1")
+
+    def index(self, tile):
+        bits = (self.empty() if tile is None
+                    else self.crosses if tile else self.noughts)
+        if not bits:
+            raise ValueError("{!r} is not on the board".format(tile))
+        return (bits & -bits).bit_length() - 1
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "BitBoard({!r})".format(list(self))
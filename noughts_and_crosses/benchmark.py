@@ -0,0 +1,186 @@
+"""
+Benchmarks for the search and checking functions in computer.py and
+checking.py, over a range of board sizes.
+
+Each board size has a fixed set of positions, made by playing random moves
+from a fixed seed, so that every run measures the same work. One JSON record
+is written per line for each board size and board type (a list, a BitBoard or
+a CountedBoard), so that results from different versions can be compared by
+other tools. Each record has:
+
+- make_groups_seconds: time to build the groups from scratch with _make_groups
+- is_run_rate, get_state_rate: calls per second over the positions
+- generate_moves_rate: moves per second generated over the positions
+- nodes, nodes_per_second: positions searched solving the mid-game positions
+  exhaustively (without a transposition table), and their rate
+- short_circuits: searches cut short by optimise in those solves
+- midgame_solve_seconds: time for get_computer_move from each mid-game
+  position, with a fresh transposition table
+- empty_solve_seconds: time to solve the empty board, where that's feasible
+- peak_memory: peak bytes allocated by Python during the mid-game solves
+"""
+
+import json
+import tracemalloc
+
+from argparse import ArgumentParser
+from collections import deque
+from platform import python_version
+from random import Random
+from time import perf_counter
+
+from base import BitBoard, State
+from checking import CountedBoard, _make_groups, is_run, get_state, get_groups
+from computer import (TranspositionTable, SearchStats, generate_moves,
+                      get_computer_move, evaluate_board, optimise)
+
+# positions of each size benchmarked
+POSITIONS = 50
+# empty tiles left in the mid-game positions, which are solved exhaustively
+MIDGAME_EMPTY = 8
+# largest board whose empty board can be solved in a benchmark
+MAX_EMPTY_SOLVE = 3
+# types of board, by name, made from a list and a size
+BOARD_TYPES = {
+    "list": lambda board, n: list(board),
+    "bitboard": lambda board, n: BitBoard(board),
+    "counted": CountedBoard,
+}
+
+def get_args():
+    """
+    Get the board sizes to benchmark
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[3, 4],
+                    help="board sizes to benchmark")
+    parser.add_argument("-b", "--boards", nargs="+", choices=BOARD_TYPES,
+                    default=list(BOARD_TYPES), help="board types to try")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                    help="number of times to time each run, keeping the best")
+    parser.add_argument("--no-memory", action="store_true",
+                    help="don't measure peak memory, which takes a while")
+    return parser.parse_args()
+
+def best_time(function, repeat):
+    """
+    Time a function, returning the shortest of several runs.
+    """
+    times = []
+    for _ in range(repeat):
+        begin = perf_counter()
+        function()
+        times.append(perf_counter() - begin)
+    return min(times)
+
+def peak_memory(function):
+    """
+    Peak memory allocated by Python while running a function.
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def make_positions(n, tiles, count=POSITIONS, seed=0):
+    """
+    Make a fixed set of unfinished positions with some number of tiles played,
+    by random play, crosses first. Returns (board, crosses_playing) pairs.
+    """
+    rng = Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = [None] * n ** 2
+        for i, pos in enumerate(rng.sample(range(n ** 2), tiles)):
+            board[pos] = i % 2 == 0
+        if get_state(board, n) == State.NEUTRAL:
+            positions.append((board, tiles % 2 == 0))
+    return positions
+
+def solve(board, crosses_playing, n, table=None, stats=None):
+    """
+    Solve a position exhaustively, trying every move like get_computer_move but
+    without its shortcut for the empty board.
+    """
+    return optimise(
+            (evaluate_board(board, crosses_playing, not crosses_playing, move,
+                            len(board) - board.count(None), n, table=table,
+                            stats=stats)
+             for move, board in generate_moves(board, crosses_playing)),
+            crosses_playing, True, stats)
+
+def benchmark(n, board_type, repeat=3, memory=True):
+    """
+    Benchmark one board size with one board type, returning a dictionary of
+    results.
+    """
+    make_board = BOARD_TYPES[board_type]
+    positions = [(make_board(board, n), crosses_playing) for board,
+                 crosses_playing in make_positions(n, n ** 2 // 2)]
+    midgame = [(make_board(board, n), crosses_playing) for board,
+               crosses_playing in make_positions(n, n ** 2 - MIDGAME_EMPTY,
+                                                 POSITIONS // 10)]
+    occupied = [(board, pos) for board, _ in positions
+                for pos in range(n ** 2) if board[pos] is not None]
+    get_groups(n)
+    moves = sum(board.count(None) for board, _ in positions)
+
+    def run_is_run():
+        for board, pos in occupied:
+            is_run(board, pos, n)
+    def run_get_state():
+        for board, _ in positions:
+            get_state(board, n)
+    def run_generate_moves():
+        for board, crosses_playing in positions:
+            deque(generate_moves(board, crosses_playing), maxlen=0)
+    def run_midgame_search(stats=None):
+        for board, crosses_playing in midgame:
+            solve(board, crosses_playing, n, stats=stats)
+    def run_midgame_moves():
+        for board, crosses_playing in midgame:
+            get_computer_move(board, crosses_playing, n,
+                              table=TranspositionTable())
+
+    stats = SearchStats()
+    run_midgame_search(stats)
+    search_time = best_time(run_midgame_search, repeat)
+    is_run_time = best_time(run_is_run, repeat)
+    get_state_time = best_time(run_get_state, repeat)
+    moves_time = best_time(run_generate_moves, repeat)
+    record = {
+        "size": n,
+        "board": board_type,
+        "make_groups_seconds": best_time(lambda: _make_groups(n), repeat),
+        "is_run_rate": len(occupied) / is_run_time,
+        "get_state_rate": len(positions) / get_state_time,
+        "generate_moves_rate": moves / moves_time,
+        "nodes": stats.nodes,
+        "nodes_per_second": stats.nodes / search_time,
+        "short_circuits": stats.short_circuits,
+        "midgame_solve_seconds": best_time(run_midgame_moves, repeat),
+        "python": python_version(),
+    }
+    if n <= MAX_EMPTY_SOLVE:
+        empty = make_board([None] * n ** 2, n)
+        record["empty_solve_seconds"] = best_time(
+            lambda: solve(empty, True, n, TranspositionTable()), repeat)
+    if memory:
+        record["peak_memory"] = peak_memory(run_midgame_moves)
+    return record
+
+def run_benchmarks(sizes, boards, repeat=3, memory=True):
+    """
+    Lazily benchmark every board size with every board type.
+    """
+    for n in sizes:
+        for board_type in boards:
+            yield benchmark(n, board_type, repeat, memory)
+
+if __name__ == "__main__":
+    args = get_args()
+    for record in run_benchmarks(args.sizes, args.boards, args.repeat,
+                                 not args.no_memory):
+        print(json.dumps(record), flush=True)
@@ -3,8 +3,9 @@ Functions implementing grid checks, efficiently.
 """
 
 from argparse import ArgumentParser
+from operator import itemgetter
 
-from base import State
+from base import State, BitBoard
 from formatting import get_board_template
 
 def get_args():
@@ -46,18 +47,260 @@ def get_groups(n):
         GROUP_REGISTRY[n] = _make_groups(n)
         return GROUP_REGISTRY[n]
 
+# The registry for groups without repetition
+ALL_GROUP_REGISTRY = {}
+
+def get_all_groups(n):
+    """
+    Access a list of every group on the board, each appearing once, rather than
+    indexed by position like get_groups.
+    """
+    if n not in ALL_GROUP_REGISTRY:
+        ALL_GROUP_REGISTRY[n] = list(dict.fromkeys(
+                        group for groups in get_groups(n) for group in groups))
+    return ALL_GROUP_REGISTRY[n]
+
+def group_mask(group):
+    """
+    Get the bitboard mask of a group, with a bit set for each of its positions.
+    """
+    return sum(1 << i for i in group)
+
+# The registry for masks
+MASK_REGISTRY = {}
+
+def get_masks(n):
+    """
+    Access the masks of the groups each position is in, indexed by position
+    like get_groups, for checking BitBoards.
+    """
+    if n not in MASK_REGISTRY:
+        MASK_REGISTRY[n] = [list(map(group_mask, groups))
+                            for groups in get_groups(n)]
+    return MASK_REGISTRY[n]
+
+# The registry for masks without repetition
+ALL_MASK_REGISTRY = {}
+
+def get_all_masks(n):
+    """
+    Access the mask of every group on the board, each appearing once.
+    """
+    if n not in ALL_MASK_REGISTRY:
+        ALL_MASK_REGISTRY[n] = list(map(group_mask, get_all_groups(n)))
+    return ALL_MASK_REGISTRY[n]
+
+def _make_symmetries(n):
+    """
+    This function should not be accessed directly - use get_symmetries.
+    Construct the 8 symmetries of the square board (rotations and reflections),
+    each as an itemgetter of, for each position, the position it is taken from.
+    Rearranging a board by each of these gives every equivalent board.
+    """
+    coords = [(i % n, i // n) for i in range(n ** 2)]
+    maps = [lambda x, y: (x, y),
+            lambda x, y: (n - 1 - y, x),
+            lambda x, y: (n - 1 - x, n - 1 - y),
+            lambda x, y: (y, n - 1 - x)]
+    maps += [lambda x, y, m=m: m(n - 1 - x, y) for m in maps]
+    return [itemgetter(*[y * n + x for x, y in (m(*c) for c in coords)])
+            for m in maps]
+
+# The registry for symmetries
+SYMMETRY_REGISTRY = {}
+
+def get_symmetries(n):
+    """
+    Access the list of symmetries of a board, generating and caching them if
+    necessary, like get_groups.
+    """
+    if n not in SYMMETRY_REGISTRY:
+        SYMMETRY_REGISTRY[n] = _make_symmetries(n)
+    return SYMMETRY_REGISTRY[n]
+
+# compact codes for the contents of a square, for canonical_form
+_square_codes = {None: 0, False: 1, True: 2}
+
+def canonical_form(board, n):
+    """
+    Get a compact, hashable form of a board which is the same for all boards
+    that are rotations or reflections of each other - the least of the tuples
+    of codes of each rearrangement of the board.
+    """
+    codes = [_square_codes[tile] for tile in board]
+    return min(symmetry(codes) for symmetry in get_symmetries(n))
+
+class CountedBoard:
+    """
+    A board along with running counts of how many tiles each player has in
+    each group, how many groups are complete for each player, how many are
+    still winnable by somebody, and how many tiles are empty. The counts are
+    updated whenever a tile is set, only looking at the groups containing that
+    tile, so that checking for wins and draws never needs to look at the board.
+    It behaves like the usual list of None, True and False, and is_run and
+    get_state recognise it.
+    """
+    def __init__(self, board, n):
+        self.board = [None] * len(board)
+        self.n = n
+        groups = self.groups = get_all_groups(n)
+        index = {group: i for i, group in enumerate(groups)}
+        self.position_groups = [[index[group] for group in pos_groups]
+                                for pos_groups in get_groups(n)]
+        # counts of tiles in each group, and of complete groups, indexed by
+        # player like state_from_bool
+        self.counts = [[0] * len(groups), [0] * len(groups)]
+        self.runs = [0, 0]
+        self.open = len(groups)
+        self.empty = len(self.board)
+        for pos, tile in enumerate(board):
+            self[pos] = tile
+
+    def is_run(self, pos):
+        """
+        Check if the tile at pos is part of a complete group.
+        """
+        counts = self.counts[self.board[pos]]
+        return any(counts[g] == self.n for g in self.position_groups[pos])
+
+    def winnable(self, group, is_crosses):
+        """
+        Check if a group (by its index in get_all_groups) could still be
+        completed by a player.
+        """
+        return not self.counts[not is_crosses][group]
+
+    def threats(self, is_crosses):
+        """
+        Get the set of positions where a player would complete a group.
+        """
+        counts, other = self.counts[is_crosses], self.counts[not is_crosses]
+        return {pos for g, group in enumerate(self.groups)
+                if counts[g] == self.n - 1 and not other[g]
+                for pos in group if self.board[pos] is None}
+
+    def is_dead(self):
+        """
+        Check if no group can be completed by either player any more, so that
+        the game must be a draw.
+        """
+        return not self.open
+
+    def state(self):
+        """
+        Get the State of the board.
+        """
+        if self.runs[True]:
+            return State.X_WIN
+        if self.runs[False]:
+            return State.O_WIN
+        return State.NEUTRAL if self.empty else State.DRAW
+
+    def empty_positions(self):
+        """
+        Generate the empty positions, in order.
+        """
+        return (pos for pos, tile in enumerate(self.board) if tile is None)
+
+    def play(self, pos, is_crosses):
+        """
+        Play in an empty position - cheaper than assigning to it.
+        """
+        counts, other = self.counts[is_crosses], self.counts[not is_crosses]
+        for g in self.position_groups[pos]:
+            count = counts[g] = counts[g] + 1
+            if count == 1 and other[g]:
+                self.open -= 1
+            if count == self.n:
+                self.runs[is_crosses] += 1
+        self.board[pos] = is_crosses
+        self.empty -= 1
+
+    def unplay(self, pos):
+        """
+        Empty a position again, undoing play.
+        """
+        tile = self.board[pos]
+        counts, other = self.counts[tile], self.counts[not tile]
+        for g in self.position_groups[pos]:
+            count = counts[g]
+            if count == self.n:
+                self.runs[tile] -= 1
+            if count == 1 and other[g]:
+                self.open += 1
+            counts[g] = count - 1
+        self.board[pos] = None
+        self.empty += 1
+
+    def __setitem__(self, pos, tile):
+        if self.board[pos] is not None:
+            self.unplay(pos)
+        if tile is not None:
+            self.play(pos, tile)
+
+    def __getitem__(self, pos):
+        return self.board[pos]
+
+    def __len__(self):
+        return len(self.board)
+
+    def __iter__(self):
+        return iter(self.board)
+
+    def count(self, tile):
+        if tile is None:
+            return self.empty
+        return self.board.count(tile)
+
+    def index(self, tile):
+        return self.board.index(tile)
+
+    def __eq__(self, other):
+        return self.board == list(other)
+
+    def __repr__(self):
+        return "CountedBoard({!r}, {!r})".format(self.board, self.n)
+
 def is_run(board, pos, n):
     """
     Check if one tile is a part of any complete groups.
     """
+    if isinstance(board, CountedBoard):
+        return board.is_run(pos)
+    if isinstance(board, BitBoard):
+        player = (board.crosses if board.crosses >> pos & 1
+                      else board.noughts)
+        return any(player & mask == mask for mask in get_masks(n)[pos])
     return any(len(set(board[i] for i in group)) == 1 for group in get_groups(n)[pos])
 
+def threats(board, is_crosses, n):
+    """
+    Get the set of positions where a player would complete a group by playing.
+    """
+    if isinstance(board, CountedBoard):
+        return board.threats(is_crosses)
+    found = set()
+    for group in get_all_groups(n):
+        tiles = [board[i] for i in group]
+        if None in tiles and tiles.count(is_crosses) == n - 1:
+            found.add(group[tiles.index(None)])
+    return found
+
 def get_state(board, n):
     """
     Get state of board. This function is given no information about position
     so is necessarily much slower. If you do know the last played tile, use
     is_run instead, as this only checks all groups pertaining to that tile.
     """
+    if isinstance(board, CountedBoard):
+        return board.state()
+    if isinstance(board, BitBoard):
+        for mask in get_all_masks(n):
+            if board.crosses & mask == mask:
+                return State.X_WIN
+            if board.noughts & mask == mask:
+                return State.O_WIN
+        return State.NEUTRAL if board.empty() else State.DRAW
     for pos, m in enumerate(board):
         if m is not None:
             if is_run(board, pos, n=n):
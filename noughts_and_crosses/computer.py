@@ -3,12 +3,17 @@ Implementation of the special case of the minmax algorithm, suited to noughts
 and crosses.
 """
 
+import json
+
+from collections import OrderedDict
+from multiprocessing import Pool
 from textwrap import indent
-from traceback import extract_stack
+from time import perf_counter
 
-from base import Win
-from checking import State, is_run
-from formatting import print_board, strfboard, syms
+from base import Win, BitBoard
+from checking import (State, CountedBoard, is_run, threats, canonical_form,
+                      get_groups, get_all_groups)
+from formatting import print_board, strfboard, syms, get_sym
 from interface import SquareBoard, isqrt
 
 from argparse import ArgumentParser
@@ -23,12 +28,160 @@ def get_args():
                     help='The initial board state')
     parser.add_argument("-q", "--quiet", action="store_true",
                     help="do not print minmax tree")
+    parser.add_argument("--trace",
+                    help="file to write the search tree to, as JSON lines")
     return parser.parse_args()
 
 # boolean-indexed array to get states compactly and quickly
 state_from_bool = [State.O_WIN, State.X_WIN]
 
-def optimise(evaluations, is_crosses, minimise):
+# default number of positions remembered by a transposition table
+TABLE_SIZE = 1 << 20
+
+class TranspositionTable:
+    """
+    A cache of the States of positions which have already been evaluated, so
+    that they are only ever searched once. Positions are keyed on the canonical
+    form of the board, so all rotations and reflections of a board share an
+    entry, along with the player to move. Once the table holds size positions,
+    the least recently used one is evicted for each new position.
+    """
+    def __init__(self, size=TABLE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(board, crosses_playing, n):
+        """
+        The key of a position in the table. Working it out is most of the cost
+        of a lookup, so it is done once and passed to both get and put.
+        """
+        return canonical_form(board, n), crosses_playing
+
+    def get(self, key):
+        """
+        Get the State of a position, by its key, or None if it isn't in the
+        table.
+        """
+        state = self.entries.get(key)
+        if state is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return state
+
+    def put(self, key, state):
+        """
+        Record the State of a position, by its key, evicting the oldest if
+        full.
+        """
+        self.entries[key] = state
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+# table shared by all searches unless they are given their own
+TRANSPOSITION_TABLE = TranspositionTable()
+
+class SearchStats:
+    """
+    Counters of what a search has done, which can be passed to the search
+    functions as stats. The search calls a method for each event - entering
+    and leaving each position, short-circuiting and finishing each root move -
+    so subclasses can hook into them, like VerboseStats. Searches without
+    stats only pay for checking that they have none.
+    If a trace file is given, each position is written to it as a line of JSON
+    once it has been searched, with the number of its parent, from which the
+    whole search tree can be rebuilt.
+    """
+    def __init__(self, trace=None):
+        self.nodes = 0
+        self.max_depth = 0
+        self.short_circuits = 0
+        self.cache_hits = 0
+        # seconds spent searching each root move
+        self.root_times = {}
+        self.trace = trace
+        # node numbers of the positions being searched, from the root
+        self.path = []
+
+    def enter(self, board, crosses_playing, prev_move, n):
+        self.nodes += 1
+        self.path.append((self.nodes, prev_move,
+                          "".join(map(get_sym, board)) if self.trace else None))
+        self.max_depth = max(self.max_depth, len(self.path))
+
+    def leave(self, result, reason):
+        """
+        Record the result of the position last entered, and why it has that
+        result: "run", "draw", "threat", "cached", "heuristic", "searched", or
+        "timeout" if the search was abandoned.
+        """
+        node, move, board = self.path.pop()
+        if reason == "cached":
+            self.cache_hits += 1
+        if self.trace is not None:
+            self.trace.write(json.dumps({
+                "node": node, "parent": self.path[-1][0] if self.path else None,
+                "move": move, "board": board, "reason": reason,
+                "result": getattr(result, "name", result)}) + "\n")
+
+    def short_circuit(self):
+        self.short_circuits += 1
+
+    def root_move(self, move, result, seconds):
+        self.root_times[move] = seconds
+
+    def summary(self):
+        """
+        The counters, as a dictionary.
+        """
+        return {"nodes": self.nodes, "max_depth": self.max_depth,
+                "short_circuits": self.short_circuits,
+                "cache_hits": self.cache_hits,
+                "root_times": self.root_times}
+
+class VerboseStats(SearchStats):
+    """
+    Stats which also print the search tree as it goes, indented by depth.
+    """
+    def enter(self, board, crosses_playing, prev_move, n):
+        print(indent("Examining as {} {}:\n{}"
+                         .format(syms[crosses_playing], len(self.path),
+                            indent(strfboard(board, n), ' ')),
+                     ' ' * len(self.path)))
+        super().enter(board, crosses_playing, prev_move, n)
+
+    def leave(self, result, reason):
+        super().leave(result, reason)
+        if reason != "searched":
+            print(indent("{}: {}".format(reason.capitalize(), result),
+                         " " * (len(self.path) + 1)))
+
+    def root_move(self, move, result, seconds):
+        super().root_move(move, result, seconds)
+        print("Move {}: {} in {:.6f}s".format(move, result, seconds))
+
+# default time allowed for each move by the alpha-beta engine, in seconds
+TIME_BUDGET = 1.0
+# score of a won position in the alpha-beta engine - larger than any heuristic
+# score, less the number of tiles played, so that quicker wins are preferred
+WIN_SCORE = 1 << 64
+
+class _OutOfTime(Exception):
+    """
+    Raised inside the alpha-beta search to abandon it when time runs out
+    """
+    pass
+
+def optimise(evaluations, is_crosses, minimise, stats=None):
     """
     "Optimise" a sequence of results for a given player. This simultaneously
     implements both minimisation and maximisation with a bit of Boolean logic.
@@ -39,6 +192,8 @@ def optimise(evaluations, is_crosses, minimise):
     draw_seen = False
     for e in evaluations:
         if e == LOSE_STATE:
+            if stats is not None:
+                stats.short_circuit()
             return e
         elif e == State.DRAW:
             draw_seen = True
@@ -46,7 +201,7 @@ def optimise(evaluations, is_crosses, minimise):
         return State.DRAW
     return WIN_STATE
 
-def generate_moves(board, is_crosses):
+def generate_moves(board, is_crosses, positions=None):
     """
     Generate possible moves on a board for a certain player. This works by
     mutating the actual board array for each possible move, followed by yielding
@@ -56,9 +211,21 @@ def generate_moves(board, is_crosses):
     A finally clause implements the restoration of the board, which guarantees
     that the board will retain its state from before after this function exits,
     even if the function is interrupted by, for example, a break.
+    BitBoards have their empty positions found from a mask rather than by
+    looking at every tile, and moves are made with a couple of bit operations.
+    Both they and CountedBoards are played on without assigning to them.
+    If positions are given, only those empty positions are played in.
     """
+    if isinstance(board, (BitBoard, CountedBoard)):
+        for ind in board.empty_positions() if positions is None else positions:
+            try:
+                board.play(ind, is_crosses)
+                yield ind, board
+            finally:
+                board.unplay(ind)
+        return
     for ind, i in enumerate(board):
-        if i is None:
+        if i is None and (positions is None or ind in positions):
             try:
                 board[ind] = is_crosses
                 yield ind, board
@@ -66,67 +233,314 @@ def generate_moves(board, is_crosses):
                 board[ind] = None
 
 def evaluate_board(board, is_crosses, crosses_playing, prev_move, depth, n,
-      verbose=False):
+      verbose=False, table=None, stats=None, draw_enough=False):
     """
     Evaluate a board-state for a given player. This recursively generates moves,
     evaluates them and optimises them.
-    Allows printing diagnostics with the verbosity parameter. It will indent
-    depending on the current length of the callstack, which helps keep track of
-    the recursion.
+    Allows keeping count of the search with a SearchStats, or printing it as
+    it goes with the verbosity parameter, which uses a VerboseStats.
+    A CountedBoard is known to be drawn as soon as no group can be won, rather
+    than once it is full.
+    If a TranspositionTable is given, positions already in it are not searched
+    again, and the results of new positions are added to it. The result of a
+    position doesn't depend on is_crosses, so one table serves both players.
+    Positions where either player is one tile away from completing a group are
+    not searched in full: the player to move wins if it is them, and otherwise
+    has to block, losing if there is more than one place to block.
+    With draw_enough, the search stops as soon as the player to move is known
+    to be able to draw, so a draw may really be a win for them. Such results
+    are not added to the table.
     """
-    verbose and print(indent("Examining as {} {}:\n{}"
-                         .format(syms[crosses_playing], depth,
-                            indent(strfboard(board, n), ' ')),
-                      ' ' * len(extract_stack())))
+    if verbose and stats is None:
+        stats = VerboseStats()
+    if stats is not None:
+        stats.enter(board, crosses_playing, prev_move, n)
     if is_run(board, prev_move, n):
         state = state_from_bool[not crosses_playing]
-        verbose and print(indent("State here: {}"
-                  .format(state), " " * len(extract_stack())))
+        if stats is not None:
+            stats.leave(state, "run")
         return state
-    elif depth == len(board):
-        verbose and print(indent("Draw here", " " * len(extract_stack())))
+    elif depth == len(board) or (isinstance(board, CountedBoard)
+                                 and board.is_dead()):
+        if stats is not None:
+            stats.leave(State.DRAW, "draw")
         return State.DRAW
-    else:
-        return optimise(
-                (evaluate_board(board, is_crosses, not crosses_playing,
-                                move, depth + 1, n, verbose=verbose)
-                   for move, board in generate_moves(board, crosses_playing)),
-                 is_crosses, not crosses_playing ^ is_crosses)
+    if threats(board, crosses_playing, n):
+        state = state_from_bool[crosses_playing]
+        if stats is not None:
+            stats.leave(state, "threat")
+        return state
+    blocks = threats(board, not crosses_playing, n)
+    if len(blocks) > 1:
+        state = state_from_bool[not crosses_playing]
+        if stats is not None:
+            stats.leave(state, "threat")
+        return state
+    if table is not None:
+        key = table.key(board, crosses_playing, n)
+        state = table.get(key)
+        if state is not None:
+            if stats is not None:
+                stats.leave(state, "cached")
+            return state
+    win_state = state_from_bool[crosses_playing]
+    state = state_from_bool[not crosses_playing]
+    for move, board in generate_moves(board, crosses_playing, blocks or None):
+        # once a draw is found, the other moves only matter if they win, so
+        # their searches can stop as soon as the opponent can draw
+        result = evaluate_board(board, is_crosses, not crosses_playing, move,
+                                depth + 1, n, table=table, stats=stats,
+                                draw_enough=state == State.DRAW)
+        if result == win_state or (result == State.DRAW and draw_enough):
+            if stats is not None:
+                stats.short_circuit()
+            state = result
+            break
+        elif result == State.DRAW:
+            state = State.DRAW
+    # a draw found when one was enough might have been a win
+    if table is not None and not (draw_enough and state == State.DRAW):
+        table.put(key, state)
+    if stats is not None:
+        stats.leave(state, "searched")
+    return state
 
-def get_computer_move(board, is_crosses, n, verbose=False):
+def get_computer_move(board, is_crosses, n, verbose=False,
+                      table=TRANSPOSITION_TABLE, stats=None):
     """
     Apply board evaluation to all possible moves and
     select, in order:
     - A winning move
     - A drawing move
     - Any move (which will be a losing move)
+    Positions are cached in table between calls - pass None to search without
+    a transposition table. The search is counted in stats, if given, including
+    the time taken by each move.
     """
     # optimisation: play here for an empty board, because searching through the
     # whole board's tree is known to be unnecessary
     if all(i is None for i in board):
         return 0
+    if verbose and stats is None:
+        stats = VerboseStats()
     WIN_STATE = state_from_bool[is_crosses]
     moves = generate_moves(board, is_crosses)
     draw = None
     for move, board in moves:
+        start = perf_counter()
         ev = evaluate_board(board, is_crosses, not is_crosses, move,
-                            len(board) - board.count(None), n, verbose=verbose)
+                            len(board) - board.count(None), n, table=table,
+                            stats=stats, draw_enough=draw is not None)
+        if stats is not None:
+            stats.root_move(move, ev, perf_counter() - start)
         if ev == WIN_STATE:
             verbose and print("Win incoming")
             return move
-        elif ev == State.DRAW:
+        elif ev == State.DRAW and draw is None:
+            # once there is a draw, later moves are only searched for wins, so
+            # their draws might really be losses
             verbose and print("Draw forcable")
             draw = move
     if draw is not None:
         return draw
     return board.index(None)
 
-def do_computer_move(board, is_crosses, n, verbose=False):
+def _evaluate_line(task):
+    """
+    Evaluate the position after a line of moves from a board, in a worker
+    process of get_parallel_move. Each worker keeps its own transposition table
+    between lines.
+    """
+    board, is_crosses, line, n = task
+    board = CountedBoard(board, n)
+    player = is_crosses
+    for move in line:
+        board[move] = player
+        if is_run(board, move, n):
+            return line, state_from_bool[player]
+        player = not player
+    if board.is_dead():
+        return line, State.DRAW
+    return line, evaluate_board(board, is_crosses, player, line[-1],
+                                len(board) - board.count(None), n,
+                                table=TRANSPOSITION_TABLE)
+
+def get_parallel_move(board, is_crosses, n, processes=None, split=1):
+    """
+    Choose a move like get_computer_move, but with the search split between a
+    pool of processes. Each possible move is searched separately, or with split
+    as 2, each reply to each move, so that there are enough pieces of work to
+    go round. A move is lost as soon as any of its replies are, and won once
+    all of them are, and as soon as a winning move is found, the rest of the
+    search is cancelled by closing the pool.
+    """
+    if all(i is None for i in board):
+        return 0
+    moves = [move for move, tile in enumerate(board) if tile is None]
+    if len(moves) == 1:
+        return moves[0]
+    WIN_STATE = state_from_bool[is_crosses]
+    LOSE_STATE = state_from_bool[not is_crosses]
+    # how good each State is for the computer, to find each move's worst reply
+    rank = {LOSE_STATE: 0, State.DRAW: 1, WIN_STATE: 2}
+    if split == 1:
+        lines = [(move,) for move in moves]
+    else:
+        lines = [(move, reply) for move in moves
+                               for reply in moves if reply != move]
+    remaining = {move: 0 for move in moves}
+    for line in lines:
+        remaining[line[0]] += 1
+    results = {}
+    with Pool(processes) as pool:
+        for line, state in pool.imap_unordered(
+                _evaluate_line, [(list(board), is_crosses, line, n)
+                                 for line in lines]):
+            move = line[0]
+            remaining[move] -= 1
+            results[move] = min(results.get(move, WIN_STATE), state,
+                                key=rank.get)
+            if not remaining[move] and results[move] == WIN_STATE:
+                return move
+    return max(moves, key=lambda move: rank[results[move]])
+
+def heuristic(board, is_crosses, n):
+    """
+    Estimate how good a board is for a player without searching any further.
+    A group which only one player has played in is still open for them to make
+    a run, and is worth more the more of it they have filled. Groups both
+    players have played in are worth nothing to either.
+    """
+    score = 0
+    for group in get_all_groups(n):
+        crosses = noughts = 0
+        for i in group:
+            if board[i] is True:
+                crosses += 1
+            elif board[i] is False:
+                noughts += 1
+        if crosses and not noughts:
+            score += 4 ** crosses
+        elif noughts and not crosses:
+            score -= 4 ** noughts
+    return score if is_crosses else -score
+
+def move_order(n):
+    """
+    Order to try moves in - tiles in the most groups first, so that the
+    strongest moves tend to be searched first and cause the most cut-offs.
+    """
+    groups = get_groups(n)
+    return sorted(range(n ** 2), key=lambda i: -len(groups[i]))
+
+def alphabeta(board, crosses_playing, prev_move, depth, alpha, beta, n, order,
+              deadline, stats=None):
+    """
+    Score a board for the player about to play, searching depth moves ahead
+    with alpha-beta pruning and falling back on the heuristic beyond that. Each
+    score is from the point of view of the player it is returned to, so the
+    two players' scores are simply negations of each other (negamax).
+    Raises _OutOfTime if the deadline passes. Cut-offs are counted in stats as
+    short-circuits.
+    """
+    if perf_counter() > deadline:
+        raise _OutOfTime
+    if stats is not None:
+        stats.enter(board, crosses_playing, prev_move, n)
+    played = len(board) - board.count(None)
+    if prev_move is not None and is_run(board, prev_move, n):
+        score, reason = played - WIN_SCORE, "run"
+    elif played == len(board):
+        score, reason = 0, "draw"
+    elif depth == 0:
+        score, reason = heuristic(board, crosses_playing, n), "heuristic"
+    else:
+        reason = "searched"
+        try:
+            for move in order:
+                if board[move] is None:
+                    board[move] = crosses_playing
+                    try:
+                        score = -alphabeta(board, not crosses_playing, move,
+                                           depth - 1, -beta, -alpha, n, order,
+                                           deadline, stats)
+                    finally:
+                        board[move] = None
+                    if score > alpha:
+                        alpha = score
+                        if alpha >= beta:
+                            if stats is not None:
+                                stats.short_circuit()
+                            break
+        except _OutOfTime:
+            if stats is not None:
+                stats.leave(None, "timeout")
+            raise
+        score = alpha
+    if stats is not None:
+        stats.leave(score, reason)
+    return score
+
+def get_timed_move(board, is_crosses, n, budget=TIME_BUDGET, verbose=False,
+                   stats=None):
+    """
+    Choose a move within a time budget, on a board of any size. This is an
+    alpha-beta search which is repeated one move deeper each time (iterative
+    deepening) until it runs out of time, finds a forced result or reaches the
+    end of the game. The best move of the deepest search which finished is
+    used. Each search tries the moves in order of how well they did in the last
+    one, which makes it much faster. The first search is always allowed to
+    finish, so that there is always a move. The searches are counted in stats,
+    if given, with the time taken by each root move in the last one.
+    """
+    order = move_order(n)
+    moves = [move for move in order if board[move] is None]
+    deadline = perf_counter() + budget
+    best = moves[0]
+    for depth in range(1, len(moves) + 1):
+        scores = {}
+        alpha = -WIN_SCORE
+        try:
+            for move in moves:
+                board[move] = is_crosses
+                start = perf_counter()
+                try:
+                    scores[move] = -alphabeta(
+                            board, not is_crosses, move, depth - 1, -WIN_SCORE,
+                            -alpha, n, order,
+                            deadline if depth > 1 else float("inf"), stats)
+                finally:
+                    board[move] = None
+                if stats is not None:
+                    stats.root_move(move, scores[move], perf_counter() - start)
+                alpha = max(alpha, scores[move])
+        except _OutOfTime:
+            break
+        moves.sort(key=lambda move: -scores[move])
+        best = moves[0]
+        verbose and print("Depth {}: best move {} scores {}".format(
+                                                depth, best, scores[best]))
+        if abs(scores[best]) > WIN_SCORE - len(board):
+            break
+    return best
+
+def do_computer_move(board, is_crosses, n, verbose=False,
+                     table=TRANSPOSITION_TABLE, budget=None, engine=None,
+                     stats=None):
     """
     Wraps get_computer_move to print some stuff, mutate the board and check for
-    winning conditions.
+    winning conditions. If a time budget is given, get_timed_move is used
+    instead, or any other function taking (board, is_crosses, n) and returning
+    a move can be given as the engine.
     """
-    move = get_computer_move(board, is_crosses, n, verbose=verbose)
+    if engine is not None:
+        move = engine(board, is_crosses, n)
+    elif budget is None:
+        move = get_computer_move(board, is_crosses, n, verbose=verbose,
+                                 table=table, stats=stats)
+    else:
+        move = get_timed_move(board, is_crosses, n, budget, verbose=verbose,
+                              stats=stats)
     board[move] = is_crosses
     print("Computer plays at ({}, {})".format(move % n, move // n))
     print_board(board, n)
@@ -134,9 +548,14 @@ def do_computer_move(board, is_crosses, n, verbose=False):
         raise Win("I'm sorry, Dave. I'm afraid I can't do that.")
 
 if __name__ == "__main__":
-    #args = get_args()
-    board = [None] * 9 #args.board
-    n = 3 #isqrt(len(args.board))
-    print(board, n)
+    args = get_args()
+    board = args.board
+    n = isqrt(len(args.board))
     print_board(board, n)
-    do_computer_move(board, True, n, verbose=True)
+    trace = open(args.trace, "w") if args.trace else None
+    stats = (SearchStats if args.quiet else VerboseStats)(trace)
+    move = get_computer_move(board, board.count(True) == board.count(False), n,
+                             table=None, stats=stats)
+    trace and trace.close()
+    print("Computer plays at ({}, {})".format(move % n, move // n))
+    print(stats.summary())
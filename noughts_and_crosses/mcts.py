@@ -0,0 +1,224 @@
+"""
+A Monte Carlo tree search computer player, for boards too big to search
+exhaustively.
+
+Rather than looking at every position, the tree is grown one node at a time
+towards whichever moves look best so far (by the UCT formula), and each new
+node is scored by playing random games out from it. The random games are
+played in batches, as one NumPy array of boards at a time: each game fills the
+empty tiles in a random order, and its winner is whoever completes a group
+soonest. The search can be stopped after any number of nodes or seconds, and
+the tree is kept between moves, so that work done on the positions which
+actually come up is not wasted.
+"""
+
+from argparse import ArgumentParser
+from math import log, sqrt
+from time import perf_counter
+
+import numpy as np
+
+from base import State
+from checking import get_all_groups, is_run
+from formatting import print_board, syms
+
+# random games played out from each new node
+PLAYOUTS = 64
+# default number of nodes to add to the tree for each move
+NODE_BUDGET = 2000
+# weight of exploring moves which have been tried less, in the UCT formula
+EXPLORATION = sqrt(2)
+
+def get_args():
+    """
+    Get the board for a demo run
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-s", "--size", type=int, default=4,
+                    help="size of board to play a game on")
+    parser.add_argument("-N", "--nodes", type=int, default=NODE_BUDGET,
+                    help="nodes to search per move")
+    parser.add_argument("-t", "--time", type=float,
+                    help="seconds to search per move, instead")
+    return parser.parse_args()
+
+def playouts(board, crosses_playing, n, count=PLAYOUTS, rng=np.random):
+    """
+    Play count random games out from a board at once. Returns the number won
+    by crosses, won by noughts and drawn.
+    """
+    groups = np.array(get_all_groups(n))
+    tiles = np.array([0 if tile is None else 1 if tile else -1
+                      for tile in board], dtype=np.int8)
+    empty = np.flatnonzero(tiles == 0)
+    # the turn each tile is played on, in each game - those already played on
+    # the board come before everything
+    order = rng.random_sample((count, len(empty))).argsort(axis=1)
+    turns = np.full((count, len(board)), -1)
+    turns[:, empty] = order
+    games = np.tile(tiles, (count, 1))
+    mover = 1 if crosses_playing else -1
+    games[:, empty] = np.where(order % 2, -mover, mover)
+    # the turn each group is finished on, which is when its last tile is played
+    finished = turns[:, groups].max(axis=2)
+    owners = games[:, groups]
+    never = len(board)
+    crosses = np.where((owners == 1).all(axis=2), finished, never).min(axis=1)
+    noughts = np.where((owners == -1).all(axis=2), finished, never).min(axis=1)
+    x_wins = int((crosses < noughts).sum())
+    o_wins = int((noughts < crosses).sum())
+    return x_wins, o_wins, count - x_wins - o_wins
+
+class Node:
+    """
+    A position in the search tree, reached by one player playing a move. Its
+    score is out of its visits, from the point of view of that player, with a
+    draw worth half a win.
+    """
+    __slots__ = ["move", "player", "parent", "children", "untried", "visits",
+                 "score", "state"]
+
+    def __init__(self, move, player, parent, untried, state):
+        self.move = move
+        self.player = player
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.score = 0
+        self.state = state
+
+    def select(self):
+        """
+        The child with the best UCT value - its average score, plus a bonus for
+        having been tried less than the others.
+        """
+        scale = EXPLORATION * sqrt(log(self.visits))
+        return max(self.children,
+                   key=lambda child: child.score / child.visits
+                                   + scale / sqrt(child.visits))
+
+    def update(self, x_wins, o_wins, draws):
+        wins = x_wins if self.player else o_wins
+        self.visits += x_wins + o_wins + draws
+        self.score += wins + draws / 2
+
+class MCTSPlayer:
+    """
+    A computer player using Monte Carlo tree search, to be used as an engine
+    for do_computer_move. It keeps its tree from one move to the next.
+    """
+    def __init__(self, nodes=NODE_BUDGET, seconds=None, playouts=PLAYOUTS,
+                 seed=None):
+        self.nodes = nodes
+        self.seconds = seconds
+        self.playouts = playouts
+        self.rng = np.random.RandomState(seed)
+        self.root = None
+        self.board = None
+
+    def __call__(self, board, is_crosses, n):
+        self.set_position(board, is_crosses)
+        self.search(n, self.nodes, self.seconds)
+        return self.best_move()
+
+    def set_position(self, board, crosses_playing):
+        """
+        Move the root of the tree to a new position. If the position follows
+        on from the last one, its part of the tree is kept.
+        """
+        root = self.root
+        if root is not None and len(self.board) == len(board):
+            played = [pos for pos, (old, new) in enumerate(zip(self.board,
+                                                               board))
+                      if old != new]
+            for _ in range(len(played)):
+                root = next((child for child in root.children
+                             if child.move in played
+                             and board[child.move] == child.player), None)
+                if root is None:
+                    break
+            if (root is not None and root.player != crosses_playing
+                    and all(self.board[pos] is None for pos in played)):
+                root.parent = None
+                self.root = root
+                self.board = list(board)
+                return
+        self.board = list(board)
+        self.root = Node(None, not crosses_playing, None,
+                         [pos for pos, tile in enumerate(board)
+                          if tile is None], State.NEUTRAL)
+
+    def search(self, n, nodes=None, seconds=None):
+        """
+        Grow the tree by up to nodes nodes, or for up to seconds seconds,
+        whichever comes first. At least one node is always grown, so that
+        there is a move to choose.
+        """
+        deadline = None if seconds is None else perf_counter() + seconds
+        for count in range(nodes or (1 << 62)):
+            if count and deadline is not None and perf_counter() > deadline:
+                break
+            self._grow(n)
+
+    def _grow(self, n):
+        node = self.root
+        board = list(self.board)
+        while not node.untried and node.children:
+            node = node.select()
+            board[node.move] = node.player
+        if node.untried and node.state is State.NEUTRAL:
+            move = node.untried.pop(self.rng.randint(len(node.untried)))
+            player = not node.player
+            board[move] = player
+            if is_run(board, move, n):
+                state = State.X_WIN if player else State.O_WIN
+            elif None not in board:
+                state = State.DRAW
+            else:
+                state = State.NEUTRAL
+            child = Node(move, player, node,
+                         [pos for pos, tile in enumerate(board)
+                          if tile is None] if state is State.NEUTRAL else [],
+                         state)
+            node.children.append(child)
+            node = child
+        if node.state is State.NEUTRAL:
+            results = playouts(board, not node.player, n, self.playouts,
+                               self.rng)
+        else:
+            # finished games count as a whole batch of playouts
+            results = [self.playouts * (node.state is state) for state in
+                       [State.X_WIN, State.O_WIN, State.DRAW]]
+        while node is not None:
+            node.update(*results)
+            node = node.parent
+
+    def best_move(self):
+        """
+        The move which has been searched the most, which is the best by the
+        search so far.
+        """
+        return max(self.root.children, key=lambda child: child.visits).move
+
+if __name__ == "__main__":
+    args = get_args()
+    n = args.size
+    board = [None] * n ** 2
+    players = [MCTSPlayer(args.nodes, args.time), MCTSPlayer(args.nodes,
+                                                             args.time)]
+    is_crosses = True
+    while True:
+        start = perf_counter()
+        move = players[is_crosses](board, is_crosses, n)
+        board[move] = is_crosses
+        print("Played ({}, {}) in {:.3f}s".format(move % n, move // n,
+                                                 perf_counter() - start))
+        print_board(board, n)
+        if is_run(board, move, n):
+            print("{} wins".format(syms[is_crosses]))
+            break
+        if None not in board:
+            print("Draw")
+            break
+        is_crosses = not is_crosses
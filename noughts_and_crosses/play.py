@@ -4,13 +4,18 @@ Play noughts and crosses. Incorporates both human and computer players.
 RUN THIS FILE TO ACTUALLY PLAY AGAINST THE COMPUTER
 """
 
+import json
+
 from argparse import ArgumentParser
+from functools import partial
 from itertools import cycle, repeat
 from textwrap import dedent
 
 from base import GameFinish, Draw
+from checking import CountedBoard
 from interface import do_player_move
-from computer import do_computer_move as _do_computer_move
+from computer import (do_computer_move as _do_computer_move, TIME_BUDGET,
+                      get_parallel_move)
 
 BOARD_SIZE = 3
 
@@ -23,7 +28,8 @@ def get_args():
     mode.add_argument("-c", "--computer", action="store_true",
                     help="play against computer opponent")
     mode.add_argument("-b", "--battle", action="store_true",
-                    help="computer plays against itself")
+                    help="computer plays against itself, headlessly, and "
+                         "prints statistics (see tournament.py)")
     parser.add_argument("--headstart", action="store_true",
                     help="start first when playing against computer")
     parser.add_argument("--noughts-start", action="store_true",
@@ -32,12 +38,41 @@ def get_args():
                     help="size of board to play on")
     parser.add_argument("-v", "--verbose", action="store_true",
                     help="Show minmax thought process")
-    return parser.parse_args()
+    parser.add_argument("-t", "--time", type=float,
+                    help="seconds the computer may take per move, using the "
+                         "alpha-beta engine rather than a full search - the "
+                         "default for boards larger than 3x3")
+    parser.add_argument("-j", "--processes", type=int,
+                    help="search exhaustively with this many processes at "
+                         "once, on boards up to 3x3, or play this many games "
+                         "at once with --battle")
+    parser.add_argument("-g", "--games", type=int, default=1000,
+                    help="number of games to play with --battle")
+    parser.add_argument("--mcts", action="store_true",
+                    help="computer uses Monte Carlo tree search, for --time "
+                         "seconds per move if given (see mcts.py)")
+    parser.add_argument("--tablebase", action="store_true",
+                    help="computer looks its moves up in a tablebase, solving "
+                         "it first if necessary (see tablebase.py)")
+    args = parser.parse_args()
+    # the parallel search is exhaustive, so it can't keep to a time budget
+    if (args.processes and not (args.battle or args.mcts or args.tablebase)
+            and (args.time is not None or args.size > 3)):
+        parser.error("-j/--processes searches exhaustively, so only works on "
+                     "boards up to 3x3, without --time")
+    if args.tablebase:
+        from tablebase import MAX_SIZE
+        if args.size > MAX_SIZE:
+            parser.error("--tablebase only works on boards up to {0}x{0}"
+                         .format(MAX_SIZE))
+    return args
 
 def play(board, players, noughts_start, n):
     """
     Play a game of noughts and crosses until a finishing condition or a draw,
-    given an infinite iterable of players.
+    given an infinite iterable of players. The board can be a CountedBoard, so
+    that the players' checks for wins and this function's check for draws
+    don't need to look through the board.
     """
     is_crosses = not noughts_start
     try:
@@ -50,8 +85,31 @@ def play(board, players, noughts_start, n):
         print("{}: {}".format(type(gf).__name__, gf))
 
 if __name__ == "__main__":
-    vb = False #args.verbose
-    do_computer_move = lambda *args: _do_computer_move(*args, verbose=vb)
+    args = get_args()
+    if args.battle:
+        from tournament import run_tournament
+        name = ("tablebase" if args.tablebase else "mcts" if args.mcts
+                else "alphabeta" if args.time or args.size > 3 else "minimax")
+        print(json.dumps(run_tournament(name, name, args.size, args.games,
+                                        args.processes, args.noughts_start,
+                                        budget=args.time)))
+        raise SystemExit
+    vb = args.verbose
+    BOARD_SIZE = args.size
+    budget = args.time
+    if budget is None and BOARD_SIZE > 3:
+        budget = TIME_BUDGET
+    engine = None
+    if args.tablebase:
+        from tablebase import get_tablebase_move as engine
+    elif args.mcts:
+        from mcts import MCTSPlayer, NODE_BUDGET
+        engine = MCTSPlayer(None if args.time else NODE_BUDGET, args.time)
+    elif args.processes:
+        engine = partial(get_parallel_move, processes=args.processes)
+    do_computer_move = lambda *args: _do_computer_move(*args, verbose=vb,
+                                                       budget=budget,
+                                                       engine=engine)
     while True:
         print("\n\n\nLet's play against the computer!")
         print(dedent("""
@@ -64,4 +122,5 @@ if __name__ == "__main__":
             > 0 1
             """.strip()))
         players = cycle([do_computer_move, do_player_move])
-        play([None] * BOARD_SIZE ** 2, players, True, BOARD_SIZE)
+        play(CountedBoard([None] * BOARD_SIZE ** 2, BOARD_SIZE), players, True,
+             BOARD_SIZE)
@@ -0,0 +1,203 @@
+"""
+A precomputed tablebase of the result of every position on an n by n board,
+and the best move from it, so that the computer can play perfectly with a
+single lookup.
+
+Positions are numbered by a perfect hash: each tile is a digit in base 3 (empty,
+crosses or noughts), and the player to move is one more bit. Every position is
+solved by retrograde analysis, working back from full boards one tile at a time,
+so that every position a move leads to has always been solved already. Each
+layer of positions is solved at once, as NumPy arrays. The table has one byte
+per position - its State, and the best move above that - and is stored as a
+.npy file, which is loaded as a memory map, so only the entries actually
+looked up are ever read from disk. 3x3 takes a fraction of a second to solve;
+4x4 takes a minute or two and 86MB, so is best solved offline with this script.
+"""
+
+import os
+
+from argparse import ArgumentParser
+from time import perf_counter
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from base import State
+from checking import get_all_groups
+
+TABLEBASE_DIR = os.environ.get("TABLEBASE_DIR",
+                               os.path.join(os.path.expanduser("~"), ".cache",
+                                            "python_demo_noughts_and_crosses"))
+# where tablebases are kept, by size of board
+TABLEBASE_PATH = os.path.join(TABLEBASE_DIR, "tablebase_{}.npy")
+# largest board which can be solved - 5x5 would take 2 * 3 ** 25 bytes, or
+# about 1.7TB
+MAX_SIZE = 4
+# number of positions solved at once, to bound memory use
+CHUNK_SIZE = 1 << 18
+# base 3 digit of each tile
+DIGITS = {None: 0, True: 1, False: 2}
+# a move is stored in the upper bits of an entry, and the State in these
+STATE_BITS = 2
+
+def get_args():
+    """
+    Get the size of board to solve
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--size", type=int, default=3,
+                    choices=range(1, MAX_SIZE + 1),
+                    help="size of board to solve")
+    parser.add_argument("-o", "--output",
+                    help="file to write, rather than TABLEBASE_PATH")
+    return parser.parse_args()
+
+def position_index(board, crosses_playing):
+    """
+    The perfect hash of a position - its index in the tablebase.
+    """
+    index = 0
+    for tile in reversed(board):
+        index = index * 3 + DIGITS[tile]
+    return index * 2 + crosses_playing
+
+def _tile_counts(cells, digit):
+    """
+    Count the tiles with a given digit in every board, in order of index.
+    Each extra cell repeats the counts so far for each of its three digits.
+    """
+    counts = np.zeros(1, dtype=np.uint8)
+    for _ in range(cells):
+        counts = np.concatenate([counts + (d == digit) for d in range(3)])
+    return counts
+
+def _solve_chunk(indices, table, n):
+    """
+    Solve a chunk of positions with the same number of tiles, given as base 3
+    numbers of boards, for both players to move. Every position with one more
+    tile must already be solved.
+    """
+    powers = 3 ** np.arange(n ** 2, dtype=np.int64)
+    digits = (indices[:, None] // powers) % 3
+    crosses = (digits == 1).sum(axis=1)
+    noughts = (digits == 2).sum(axis=1)
+    x_win = np.zeros(len(indices), dtype=bool)
+    o_win = np.zeros(len(indices), dtype=bool)
+    for group in get_all_groups(n):
+        x_win |= (digits[:, group] == 1).all(axis=1)
+        o_win |= (digits[:, group] == 2).all(axis=1)
+    empty = digits == 0
+    for crosses_playing in [True, False]:
+        mover = crosses if crosses_playing else noughts
+        other = noughts if crosses_playing else crosses
+        # the player to move has either played as many tiles as the other, or
+        # one fewer if they didn't start
+        valid = (other - mover >= 0) & (other - mover <= 1) & ~(x_win & o_win)
+        entry = np.full(len(indices), State.NEUTRAL.value, dtype=np.uint8)
+        entry[valid & x_win] = State.X_WIN.value
+        entry[valid & o_win] = State.O_WIN.value
+        entry[valid & ~x_win & ~o_win & ~empty.any(axis=1)] = State.DRAW.value
+        playing = valid & ~x_win & ~o_win & empty.any(axis=1)
+        if playing.any():
+            entry[playing] = _solve_moves(indices[playing], empty[playing],
+                                          crosses_playing, table, powers)
+        table[indices * 2 + crosses_playing] = entry
+
+def _solve_moves(indices, empty, crosses_playing, table, powers):
+    """
+    Solve positions which are still being played, from the positions after
+    each possible move: play a winning move, or else a drawing move, or else
+    any move at all.
+    """
+    win = State.X_WIN if crosses_playing else State.O_WIN
+    lose = State.O_WIN if crosses_playing else State.X_WIN
+    digit = DIGITS[crosses_playing]
+    # tiles which are already taken are looked up as the position itself, and
+    # then ignored
+    after = table[(indices[:, None] + digit * powers * empty) * 2
+                  + (not crosses_playing)] & ((1 << STATE_BITS) - 1)
+    after[~empty] = State.NEUTRAL.value
+    entry = np.full(len(indices), lose.value, dtype=np.uint8)
+    move = empty.argmax(axis=1)
+    for state in [State.DRAW, win]:
+        found = (after == state.value).any(axis=1)
+        entry[found] = state.value
+        move[found] = (after[found] == state.value).argmax(axis=1)
+    return entry | (move << STATE_BITS).astype(np.uint8)
+
+def solve(n, table):
+    """
+    Solve every position on an n by n board into an array of 2 * 3 ** (n ** 2)
+    entries, starting from full boards and working back one tile at a time.
+    """
+    cells = n ** 2
+    tiles = _tile_counts(cells, 1) + _tile_counts(cells, 2)
+    for count in reversed(range(cells + 1)):
+        layer = np.flatnonzero(tiles == count)
+        for i in range(0, len(layer), CHUNK_SIZE):
+            _solve_chunk(layer[i:i + CHUNK_SIZE], table, n)
+    return table
+
+def _check_size(n):
+    if n > MAX_SIZE:
+        raise ValueError("can't solve a {0}x{0} tablebase, only up to {1}x{1}"
+                         .format(n, MAX_SIZE))
+
+def write_tablebase(n, path=None):
+    """
+    Solve a board size straight into a new tablebase file. It is written under
+    a temporary name and renamed once finished, so an interrupted solve never
+    leaves a broken tablebase behind.
+    """
+    _check_size(n)
+    path = path or TABLEBASE_PATH.format(n)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    table = open_memmap(temporary, mode="w+", dtype=np.uint8,
+                        shape=(2 * 3 ** (n ** 2),))
+    try:
+        solve(n, table)
+        table.flush()
+    except BaseException:
+        del table
+        os.remove(temporary)
+        raise
+    del table
+    os.replace(temporary, path)
+
+# The registry for loaded tablebases
+TABLEBASE_REGISTRY = {}
+
+def get_tablebase(n, path=None):
+    """
+    Access the tablebase for a board size as a read-only memory map, solving
+    and writing it first if there isn't one.
+    """
+    _check_size(n)
+    if n not in TABLEBASE_REGISTRY:
+        path = path or TABLEBASE_PATH.format(n)
+        if not os.path.exists(path):
+            write_tablebase(n, path)
+        TABLEBASE_REGISTRY[n] = np.load(path, mmap_mode="r")
+    return TABLEBASE_REGISTRY[n]
+
+def lookup(board, crosses_playing, n):
+    """
+    Get the State of a position, with best play from both sides, and the best
+    move from it.
+    """
+    entry = int(get_tablebase(n)[position_index(board, crosses_playing)])
+    return State(entry & ((1 << STATE_BITS) - 1)), entry >> STATE_BITS
+
+def get_tablebase_move(board, is_crosses, n):
+    """
+    Choose a move with one lookup, in place of get_computer_move.
+    """
+    return lookup(board, is_crosses, n)[1]
+
+if __name__ == "__main__":
+    args = get_args()
+    start = perf_counter()
+    write_tablebase(args.size, args.output)
+    print("Solved {0}x{0} in {1:.3f}s".format(args.size,
+                                              perf_counter() - start))
@@ -0,0 +1,178 @@
+"""
+Headless self-play between the computer players, to compare them at scale.
+
+Games are played in batches by a pool of worker processes, with nothing
+printed along the way. Each batch reports how its games finished, how many
+moves were played and how long each move took, and these are added up into
+one JSON record with:
+
+- crosses_wins, noughts_wins, draws: results of the games
+- games_per_second, moves_per_second: throughput over the whole run
+- latency_histogram: number of moves taking under each power of two of
+  microseconds, for each player
+- mean_latency: mean seconds per move for each player
+
+The first few moves of each game are played at random, so that deterministic
+players don't just play the same game over and over.
+"""
+
+import json
+
+from argparse import ArgumentParser
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool, cpu_count
+from random import Random
+from time import perf_counter
+
+from base import State
+from checking import CountedBoard
+from computer import get_computer_move, get_timed_move, state_from_bool
+
+# games played by each worker process at a time
+BATCH_SIZE = 100
+# moves played at random at the start of each game
+RANDOM_OPENING = 2
+# seconds per move for the alpha-beta player, unless another budget is given
+TOURNAMENT_BUDGET = 0.01
+
+def _random_player(rng, budget):
+    return lambda board, is_crosses, n: rng.choice(
+                [pos for pos, tile in enumerate(board) if tile is None])
+
+def _alphabeta_player(rng, budget):
+    return partial(get_timed_move,
+                   budget=TOURNAMENT_BUDGET if budget is None else budget)
+
+def _mcts_player(rng, budget):
+    from mcts import MCTSPlayer, NODE_BUDGET
+    return MCTSPlayer(NODE_BUDGET if budget is None else None, budget,
+                      seed=rng.randrange(1 << 32))
+
+def _tablebase_player(rng, budget):
+    from tablebase import get_tablebase_move
+    return get_tablebase_move
+
+# ways to make each player, given a random number generator and the seconds it
+# may take per move, or None for its default. Each worker makes its own, as
+# some players keep state between moves.
+ENGINES = {
+    "minimax": lambda rng, budget: get_computer_move,
+    "alphabeta": _alphabeta_player,
+    "tablebase": _tablebase_player,
+    "mcts": _mcts_player,
+    "random": _random_player,
+}
+
+def get_args():
+    """
+    Get the players and the number of games
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("crosses", choices=ENGINES, help="player for crosses")
+    parser.add_argument("noughts", choices=ENGINES, help="player for noughts")
+    parser.add_argument("-g", "--games", type=int, default=1000,
+                    help="number of games to play")
+    parser.add_argument("-s", "--size", type=int, default=3,
+                    help="size of board to play on")
+    parser.add_argument("-p", "--processes", type=int, default=cpu_count(),
+                    help="number of worker processes")
+    parser.add_argument("--noughts-start", action="store_true",
+                    help="noughts to start instead of crosses")
+    parser.add_argument("--opening", type=int, default=RANDOM_OPENING,
+                    help="number of random moves at the start of each game")
+    parser.add_argument("--seed", type=int, default=0,
+                    help="seed for the random moves")
+    parser.add_argument("-t", "--time", type=float,
+                    help="seconds per move for the players which take a time "
+                         "budget, rather than their defaults")
+    return parser.parse_args()
+
+def play_game(players, n, noughts_start=False, opening=RANDOM_OPENING,
+              rng=None):
+    """
+    Play one game between two players, indexed by whether they play crosses,
+    without printing anything. Returns the final State, and a list of the
+    player and time taken for each move they chose.
+    """
+    rng = rng or Random()
+    board = CountedBoard([None] * n ** 2, n)
+    is_crosses = not noughts_start
+    timings = []
+    for ply in range(n ** 2):
+        if ply < opening:
+            move = rng.choice(list(board.empty_positions()))
+        else:
+            start = perf_counter()
+            move = players[is_crosses](board, is_crosses, n)
+            timings.append((is_crosses, perf_counter() - start))
+        board[move] = is_crosses
+        if board.is_run(move):
+            return state_from_bool[is_crosses], timings
+        is_crosses = not is_crosses
+    return State.DRAW, timings
+
+def _play_batch(task):
+    """
+    Play a batch of games in a worker process, returning its statistics.
+    """
+    names, n, games, noughts_start, opening, seed, budget = task
+    rng = Random(seed)
+    players = [ENGINES[name](rng, budget) for name in names]
+    results = Counter()
+    # histograms of move times, by the bit length of the time in microseconds
+    histograms = [Counter(), Counter()]
+    totals = [0, 0]
+    for _ in range(games):
+        state, timings = play_game(players, n, noughts_start, opening, rng)
+        results[state.name] += 1
+        for is_crosses, time in timings:
+            histograms[is_crosses][int(time * 1e6).bit_length()] += 1
+            totals[is_crosses] += time
+    return results, histograms, totals
+
+def run_tournament(crosses, noughts, n=3, games=1000, processes=None,
+                   noughts_start=False, opening=RANDOM_OPENING, seed=0,
+                   batch_size=BATCH_SIZE, budget=None):
+    """
+    Play games between two players, named as in ENGINES, spread over a pool
+    of processes, with budget seconds per move if given. Returns a dictionary
+    of statistics.
+    """
+    tasks = [((noughts, crosses), n, min(batch_size, games - start),
+              noughts_start, opening, seed + start, budget)
+             for start in range(0, games, batch_size)]
+    results = Counter()
+    histograms = [Counter(), Counter()]
+    totals = [0, 0]
+    begin = perf_counter()
+    with Pool(processes) as pool:
+        for batch in pool.imap_unordered(_play_batch, tasks):
+            results.update(batch[0])
+            for player in [False, True]:
+                histograms[player].update(batch[1][player])
+                totals[player] += batch[2][player]
+    elapsed = perf_counter() - begin
+    moves = [sum(histogram.values()) for histogram in histograms]
+    names = ["noughts", "crosses"]
+    return {"crosses": crosses, "noughts": noughts, "size": n, "games": games,
+            "crosses_wins": results[State.X_WIN.name],
+            "noughts_wins": results[State.O_WIN.name],
+            "draws": results[State.DRAW.name],
+            "games_per_second": games / elapsed,
+            "moves_per_second": sum(moves) / elapsed,
+            "latency_histogram": {
+                names[player]: {"<{}us".format(1 << bits): count
+                                for bits, count
+                                in sorted(histograms[player].items())}
+                for player in [True, False]},
+            "mean_latency": {
+                names[player]: totals[player] / max(moves[player], 1)
+                for player in [True, False]}}
+
+if __name__ == "__main__":
+    args = get_args()
+    print(json.dumps(run_tournament(args.crosses, args.noughts, args.size,
+                                    args.games, args.processes,
+                                    args.noughts_start, args.opening,
+                                    args.seed, budget=args.time)))
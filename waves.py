@@ -4,9 +4,14 @@ Indefinitely draw a quantised sine wave, parametrised by the below constants
 Press Ctrl+C to interrupt.
 """
 
-from time import sleep
-from math import sin, pi
-from itertools import cycle
+import asyncio
+import sys
+
+from argparse import ArgumentParser
+from functools import lru_cache
+from time import monotonic
+from math import sin, pi, sqrt
+from itertools import cycle, islice
 
 # global constants - you can edit these
 LINES_PER_PERIOD = 40
@@ -22,13 +27,194 @@ sin_wave = lambda x: (sin(x) + 1) / 2
 square_wave = lambda x: 1 if x % (2 * pi) > pi else 0
 sawtooth_wave = lambda x: (x % (2 * pi)) / (2 * pi)
 
+WAVES = [sin_wave, square_wave, sawtooth_wave]
+
+# what a stream does when it falls behind: write all of the lines it missed as
+# quickly as possible, or drop them and carry on from the current time
+CATCH_UP, SKIP = "catch-up", "skip"
+# how late a line can be, in seconds, before a skipping stream drops it
+SKIP_TOLERANCE = 0.1
+
+def get_args():
+    """
+    Get the output mode
+    """
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("-f", "--fast", action="store_true",
+                    help="write as fast as possible rather than at "
+                         "LINES_PER_SECOND, in large blocks")
+    parser.add_argument("-n", "--lines", type=int,
+                    help="stop after this many lines, in fast mode")
+    parser.add_argument("-o", "--output",
+                    help="file to write to in fast mode, rather than stdout")
+    parser.add_argument("-r", "--rates", type=float, nargs="+",
+                    help="run several concurrent streams to stdout at these "
+                         "rates, reporting their timing to stderr")
+    parser.add_argument("-d", "--duration", type=float,
+                    help="stop the streams after this many seconds")
+    parser.add_argument("-p", "--policy", choices=[CATCH_UP, SKIP],
+                    default=CATCH_UP, help="what streams do when behind")
+    parser.add_argument("-t", "--tolerance", type=float,
+                    default=SKIP_TOLERANCE,
+                    help="seconds late a line can be before it is skipped")
+    return parser.parse_args()
+
+@lru_cache(maxsize=None)
+def render_period(wave, max_width=MAX_WIDTH, use_ascii=USE_ASCII,
+                  lines_per_period=LINES_PER_PERIOD):
+    """
+    Get the lines making up one period of a wave. Every period is the same, so
+    this is only worked out once for each wave and set of parameters.
+    """
+    return tuple(("-" if use_ascii else "\u2500")
+                 * int(max_width * wave(2 * pi * x / lines_per_period))
+                 for x in range(lines_per_period))
+
+@lru_cache(maxsize=None)
+def render_cycle(max_width=MAX_WIDTH, use_ascii=USE_ASCII,
+                 lines_per_period=LINES_PER_PERIOD,
+                 periods_per_wave=PERIODS_PER_WAVE):
+    """
+    Get one whole cycle through all of the waves as encoded text, ready to be
+    written out in one go, along with its number of lines.
+    """
+    lines = [line for wave in WAVES
+                  for line in render_period(wave, max_width, use_ascii,
+                                            lines_per_period)
+                               * periods_per_wave]
+    return "".join(line + "\n" for line in lines).encode(), len(lines)
+
+def write_fast(out, lines=None):
+    """
+    Write the waves to a binary file as fast as possible, a whole cycle of
+    waves per write, stopping after a number of lines if given.
+    """
+    block, block_lines = render_cycle()
+    written = 0
+    while lines is None or written + block_lines <= lines:
+        out.write(block)
+        written += block_lines
+    if lines is not None and written < lines:
+        out.write(b"".join(block.splitlines(True)[:lines - written]))
+    out.flush()
+
+def iter_lines():
+    """
+    Lazily generate the lines of every wave in turn, forever.
+    """
+    for wave in cycle(WAVES):
+        yield from render_period(wave) * PERIODS_PER_WAVE
+
+class WaveStream:
+    """
+    A stream of wave lines written to a text file at a fixed rate. The time
+    each line is due is worked out from the start time and the number of lines
+    so far, against a monotonic clock, so time spent writing never adds up as
+    drift. Whenever it wakes up, the stream writes every line which is due, so
+    rates beyond the resolution of the event loop still hold on average. Lines
+    missed while the stream was held up are either written straight away or,
+    if they are more than tolerance seconds late, skipped, depending on the
+    policy.
+    """
+    def __init__(self, out, rate=LINES_PER_SECOND, policy=CATCH_UP,
+                 lines=None, tolerance=SKIP_TOLERANCE):
+        self.out = out
+        self.rate = rate
+        self.policy = policy
+        self.tolerance = tolerance
+        self.lines = iter_lines() if lines is None else lines
+        self.written = 0
+        self.skipped = 0
+        # statistics of how late each line was written, in seconds
+        self.lateness_total = 0
+        self.lateness_squares = 0
+        self.lateness_max = 0
+        self.start = self.end = None
+
+    async def run(self, duration=None):
+        """
+        Write lines until duration seconds have passed, or forever.
+        """
+        self.start = monotonic()
+        due = 0
+        try:
+            while duration is None or due < duration * self.rate:
+                now = monotonic()
+                wait = self.start + due / self.rate - now
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    now = monotonic()
+                behind = int((now - self.start) * self.rate) - due
+                # lines due more than tolerance seconds ago
+                late = (int((now - self.start - self.tolerance) * self.rate)
+                        - due)
+                if self.policy == SKIP and late > 0:
+                    # advance the iterator in place, rather than wrapping it
+                    next(islice(self.lines, late, late), None)
+                    self.skipped += late
+                    due += late
+                    behind -= late
+                if duration is not None:
+                    behind = min(behind, int(duration * self.rate) - due - 1)
+                for _ in range(behind + 1):
+                    self._write(next(self.lines),
+                                now - self.start - due / self.rate)
+                    due += 1
+                self.out.flush()
+                # let other streams run even if this one is catching up
+                await asyncio.sleep(0)
+            if duration is not None:
+                # the last line's time slot lasts until the very end
+                await asyncio.sleep(self.start + duration - monotonic())
+        finally:
+            self.end = monotonic()
+
+    def _write(self, line, lateness):
+        self.out.write(line + "\n")
+        self.written += 1
+        self.lateness_total += lateness
+        self.lateness_squares += lateness ** 2
+        self.lateness_max = max(self.lateness_max, lateness)
+
+    def stats(self):
+        """
+        Achieved rate and timing jitter of the stream so far, as a dictionary.
+        """
+        elapsed = (self.end or monotonic()) - self.start
+        mean = self.lateness_total / max(self.written, 1)
+        return {"rate": self.rate,
+                "achieved_rate": self.written / elapsed if elapsed else 0,
+                "written": self.written,
+                "skipped": self.skipped,
+                "mean_lateness": mean,
+                "jitter": sqrt(max(self.lateness_squares
+                                   / max(self.written, 1) - mean ** 2, 0)),
+                "max_lateness": self.lateness_max}
+
+async def run_streams(streams, duration=None):
+    """
+    Run several streams concurrently in one event loop.
+    """
+    await asyncio.gather(*(stream.run(duration) for stream in streams))
+
 def main():
-    for wave in cycle([sin_wave, square_wave, sawtooth_wave]):
-        for x in range(PERIODS_PER_WAVE * LINES_PER_PERIOD):
-            print(("-" if USE_ASCII else "\u2500")
-                * int(MAX_WIDTH * wave(2 * pi * x / LINES_PER_PERIOD)),
-                flush=True)
-            sleep(1 / LINES_PER_SECOND)
+    asyncio.run(WaveStream(sys.stdout).run())
 
 if __name__ == "__main__":
-    main()
+    args = get_args()
+    if args.rates:
+        streams = [WaveStream(sys.stdout, rate, args.policy,
+                              tolerance=args.tolerance)
+                   for rate in args.rates]
+        try:
+            asyncio.run(run_streams(streams, args.duration))
+        finally:
+            for stream in streams:
+                print(stream.stats(), file=sys.stderr)
+    elif not args.fast:
+        main()
+    elif args.output:
+        with open(args.output, "wb") as f:
+            write_fast(f, args.lines)
+    else:
+        write_fast(sys.stdout.buffer, args.lines)